@@ -0,0 +1,154 @@
+"""In-process caching helpers.
+
+Read-through caches for rarely-changing documents, and per-collection version
+counters that drive ETag/conditional GET handling. Both are invalidated by the
+endpoints that modify the underlying data.
+"""
+import asyncio
+import hashlib
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+from starlette.routing import compile_path
+
+# Every cache created in the process, by name, for stats reporting
+caches: Dict[str, "ReadThroughCache"] = {}
+
+
+class ReadThroughCache:
+    def __init__(self, name: str, ttl: float):
+        self.name = name
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        # Bumped on invalidation so a load that started earlier does not store a stale value
+        self._generation = 0
+        caches[name] = self
+
+    def _fresh(self, key: Hashable) -> Optional[Tuple[float, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry
+        return None
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._fresh(key)
+        if entry is not None:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # A concurrent miss may have loaded the value while we waited
+            entry = self._fresh(key)
+            if entry is not None:
+                return entry[1]
+            generation = self._generation
+            value = await loader()
+            if generation == self._generation:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+            return value
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        self._generation += 1
+        self.invalidations += 1
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: cache.stats() for name, cache in caches.items()}
+
+
+class CollectionVersions:
+    """Change counters per logical collection, bumped by every mutating endpoint.
+
+    ETags are derived from the counters of the collections a response depends on,
+    so they can be checked without touching the database.
+    """
+
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        # Distinguishes this process's counters from those of earlier runs or other workers
+        self.instance = uuid.uuid4().hex[:8]
+
+    def get(self, name: str) -> int:
+        return self._versions.get(name, 0)
+
+    def bump(self, *names: str):
+        for name in names:
+            self._versions[name] = self._versions.get(name, 0) + 1
+
+    def etag(self, names: Iterable[str], variant: str = "") -> str:
+        state = ".".join(str(self.get(name)) for name in names)
+        digest = hashlib.sha1(variant.encode()).hexdigest()[:8]
+        return f'"{self.instance}-{state}-{digest}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class ConditionalGetMiddleware:
+    """Tags GET responses of versioned routes with an ETag and answers a matching
+    If-None-Match with 304 before the route runs.
+
+    `routes` maps route path templates (e.g. "/api/categories/{category_id}/videos")
+    to the collections their response depends on.
+    """
+
+    def __init__(self, app, versions: CollectionVersions, routes: Dict[str, Tuple[str, ...]]):
+        self.app = app
+        self.versions = versions
+        self.routes = [(compile_path(path)[0], collections) for path, collections in routes.items()]
+
+    def _collections_for(self, path: str) -> Optional[Tuple[str, ...]]:
+        for pattern, collections in self.routes:
+            if pattern.match(path):
+                return collections
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            return await self.app(scope, receive, send)
+        collections = self._collections_for(scope["path"])
+        if collections is None:
+            return await self.app(scope, receive, send)
+
+        # Computed before the route reads anything, so a concurrent write can only make it older
+        etag = self.versions.etag(collections, scope["path"] + "?" + scope.get("query_string", b"").decode())
+        request_headers = Headers(scope=scope)
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, etag):
+            return await Response(status_code=304, headers={"ETag": etag})(scope, receive, send)
+
+        async def send_with_etag(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                headers = MutableHeaders(scope=message)
+                headers["ETag"] = etag
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
@@ -0,0 +1,147 @@
+"""Cross-worker cache invalidation.
+
+Each worker process keeps its own caches and ETag version counters, so a write
+handled by one worker must reach the others. The bus either follows a MongoDB
+change stream on the watched collections (replica sets only) or polls per-collection
+version counters that every writer increments, and calls `on_change` with the
+names of the collections another worker changed.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence
+
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+VERSIONS_COLLECTION = "cache_versions"
+RETRY_DELAY_SECONDS = 5
+
+
+def _change_streams_unsupported(error: OperationFailure) -> bool:
+    # 40573: "The $changeStream stage is only supported on replica sets"
+    return error.code in (40573, 40324) or "replica set" in str(error)
+
+
+class InvalidationBus:
+    def __init__(
+        self,
+        db,
+        collections: Sequence[str],
+        on_change: Callable[[Iterable[str]], None],
+        mode: str = "auto",
+        poll_interval: float = 2.0
+    ):
+        if mode not in ("auto", "changestream", "poll"):
+            raise ValueError(f"Unknown invalidation mode {mode!r}")
+        self.db = db
+        self.collections = list(collections)
+        self.on_change = on_change
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self._seen: Dict[str, int] = {}
+        self.received = 0
+        self.published = 0
+        self.restarts = 0
+        self.last_change_at: Optional[float] = None
+
+    async def publish(self, names: Iterable[str]):
+        """Record local changes for the other workers. Only polling needs it."""
+        names = [name for name in names if name in self.collections]
+        if self.mode == "changestream" or not names:
+            return
+        await self.db[VERSIONS_COLLECTION].bulk_write(
+            [UpdateOne({"_id": name}, {"$inc": {"version": 1}}, upsert=True) for name in names],
+            ordered=False
+        )
+        self.published += len(names)
+
+    def _notify(self, names: Iterable[str]):
+        names = list(names)
+        if names:
+            self.received += len(names)
+            self.last_change_at = time.time()
+            self.on_change(names)
+
+    async def run(self):
+        requested = self.mode
+        if requested in ("auto", "changestream"):
+            try:
+                await self._follow_change_stream()
+            except OperationFailure as e:
+                # Only raised when the deployment cannot run change streams at all
+                if requested == "changestream":
+                    logger.error(f"INVALIDATION_MODE=changestream but change streams are unavailable ({e}); "
+                                 "polling cache versions instead")
+                else:
+                    logger.info("Change streams unavailable (not a replica set); polling cache versions instead")
+                self.mode = "poll"
+        await self._poll()
+
+    async def _follow_change_stream(self):
+        pipeline = [{"$match": {"ns.coll": {"$in": self.collections}}}]
+        resume_token = None
+        # Set when changes may have been missed: the stream restarted without a resume token
+        missed = False
+        while True:
+            try:
+                async with self.db.watch(pipeline, resume_after=resume_token) as stream:
+                    if self.mode == "auto":
+                        self.mode = "changestream"
+                        logger.info(f"Following change streams on {', '.join(self.collections)}")
+                    if missed:
+                        self.restarts += 1
+                        self._notify(self.collections)
+                        missed = False
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        self._notify([change["ns"]["coll"]])
+            except OperationFailure as e:
+                if _change_streams_unsupported(e):
+                    raise
+                # E.g. ChangeStreamHistoryLost (286): the resume token fell off the oplog.
+                # Start over from now and treat every watched collection as changed.
+                logger.error(f"Invalidation change stream failed: {e}; restarting in {RETRY_DELAY_SECONDS}s")
+                resume_token = None
+                missed = True
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+            except PyMongoError as e:
+                logger.warning(f"Invalidation change stream interrupted: {e}; resuming in {RETRY_DELAY_SECONDS}s")
+                missed = resume_token is None
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+
+    async def _read_versions(self) -> Dict[str, int]:
+        docs = await self.db[VERSIONS_COLLECTION].find({"_id": {"$in": self.collections}}).to_list(None)
+        return {doc["_id"]: doc.get("version", 0) for doc in docs}
+
+    async def _poll(self):
+        while True:
+            try:
+                self._seen = await self._read_versions()
+                break
+            except PyMongoError as e:
+                logger.warning(f"Could not read cache versions: {e}; retrying in {RETRY_DELAY_SECONDS}s")
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                versions = await self._read_versions()
+            except PyMongoError as e:
+                logger.warning(f"Cache version poll failed: {e}")
+                continue
+            changed = [name for name, version in versions.items() if version != self._seen.get(name)]
+            self._seen = versions
+            self._notify(changed)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "collections": self.collections,
+            "received": self.received,
+            "published": self.published,
+            "restarts": self.restarts,
+            "last_change_at": self.last_change_at,
+            "poll_interval_seconds": self.poll_interval if self.mode == "poll" else None,
+        }
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""Load-testing harness for the hot API endpoints.
+
+Drives the ASGI app in-process (default) or a running server over HTTP, seeds a
+dataset through the public API and runs concurrent scenarios, reporting
+throughput, p50/p95/p99 latency and database operations per request.
+
+Examples (from the backend directory):
+
+    python loadtest.py --backend memory --requests 2000 --concurrency 50
+    python loadtest.py --backend mongo --scenario heartbeats --scenario dashboard
+    python loadtest.py --base-url http://localhost:8001 --output results.json
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+import typer
+from pymongo import monitoring
+
+cli = typer.Typer(help="Load-test the training platform API")
+
+# One log line per request would dominate the run time
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts commands sent to MongoDB by every client created after registration."""
+
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class Target:
+    """The system under test: an HTTP client plus a way to read its DB operation count."""
+
+    def __init__(self, client: httpx.AsyncClient, db_ops: Optional[Callable[[], int]] = None, shutdown=None):
+        self.client = client
+        self.db_ops = db_ops
+        self.shutdown = shutdown
+
+    async def close(self):
+        await self.client.aclose()
+        if self.shutdown is not None:
+            await self.shutdown()
+
+
+async def in_process_target(backend: str, timeout: float) -> Target:
+    os.environ["STORAGE_BACKEND"] = backend
+    counter = CommandCounter()
+    monitoring.register(counter)
+
+    import server  # imported late so STORAGE_BACKEND is honoured
+    await server.app.router.startup()
+
+    def db_ops() -> int:
+        commands = getattr(server.db, "commands", None)
+        return sum(commands.values()) if commands is not None else counter.count
+
+    client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=server.app),
+        base_url="http://loadtest",
+        timeout=timeout
+    )
+    return Target(client, db_ops, server.app.router.shutdown)
+
+
+def http_target(base_url: str, timeout: float, concurrency: int) -> Target:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    return Target(httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits))
+
+
+# Dataset
+
+SEED_PASSWORD = "loadtest"
+
+class Dataset:
+    def __init__(self, users: List[str], videos: List[Dict[str, Any]], categories: List[Dict[str, Any]]):
+        self.users = users
+        self.videos = videos
+        self.categories = categories
+
+
+async def _gather_limited(calls: List[Callable[[], Awaitable[Any]]], concurrency: int) -> List[Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(call):
+        async with semaphore:
+            return await call()
+
+    return await asyncio.gather(*(run(call) for call in calls))
+
+
+async def seed_dataset(client: httpx.AsyncClient, users: int, videos: int, progress: int,
+                       concurrency: int, rng: random.Random) -> Dataset:
+    response = await client.get("/api/categories", params={"include_videos": "false"})
+    response.raise_for_status()
+    categories = response.json()
+
+    run_id = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    emails = [f"loadtest-{run_id}-{i}@example.com" for i in range(users)]
+
+    async def create_user(email):
+        response = await client.post("/api/users", json={"email": email, "password": SEED_PASSWORD, "name": email})
+        response.raise_for_status()
+
+    async def create_video(i):
+        response = await client.post("/api/videos", json={
+            "title": f"Load test video {i}",
+            "description": "Video created by loadtest.py",
+            "thumbnail": "https://example.com/thumbnail.jpg",
+            "duration": "10:00",
+            "youtubeId": "dQw4w9WgXcQ",
+            "match": "95%",
+            "difficulty": rng.choice(["Básico", "Intermedio", "Avanzado"]),
+            "rating": round(rng.uniform(3, 5), 1),
+            "views": 0,
+            "releaseDate": "2024",
+            "categoryId": categories[i % len(categories)]["id"]
+        })
+        response.raise_for_status()
+        return response.json()
+
+    await _gather_limited([lambda email=email: create_user(email) for email in emails], concurrency)
+    created_videos = await _gather_limited([lambda i=i: create_video(i) for i in range(videos)], concurrency)
+
+    # Historical progress, sent through the batch endpoint in chunks
+    records = [_random_heartbeat(rng, emails, created_videos) for _ in range(progress)]
+    chunks = [records[i:i + 500] for i in range(0, len(records), 500)]
+
+    async def send_chunk(chunk):
+        response = await client.post("/api/video-progress/batch", json=chunk)
+        response.raise_for_status()
+
+    await _gather_limited([lambda chunk=chunk: send_chunk(chunk) for chunk in chunks], concurrency)
+    return Dataset(emails, created_videos, categories)
+
+
+def _random_heartbeat(rng: random.Random, users: List[str], videos: List[Dict[str, Any]]) -> Dict[str, Any]:
+    progress = rng.uniform(0, 100)
+    return {
+        "user_email": rng.choice(users),
+        "video_id": rng.choice(videos)["id"],
+        "progress_percentage": round(progress, 2),
+        "watch_time": int(progress * 6),
+        "completed": progress > 90
+    }
+
+
+# Scenarios: each returns one request for the given dataset
+
+Scenario = Callable[[httpx.AsyncClient, Dataset, random.Random], Awaitable[httpx.Response]]
+
+
+async def heartbeat_scenario(client: httpx.AsyncClient, data: Dataset, rng: random.Random) -> httpx.Response:
+    return await client.post("/api/video-progress", json=_random_heartbeat(rng, data.users, data.videos))
+
+
+async def dashboard_scenario(client: httpx.AsyncClient, data: Dataset, rng: random.Random) -> httpx.Response:
+    return await client.get(f"/api/dashboard/{rng.choice(data.users)}")
+
+
+async def catalogue_scenario(client: httpx.AsyncClient, data: Dataset, rng: random.Random) -> httpx.Response:
+    return await client.get("/api/categories")
+
+
+async def videos_scenario(client: httpx.AsyncClient, data: Dataset, rng: random.Random) -> httpx.Response:
+    return await client.get("/api/videos")
+
+
+async def admin_stats_scenario(client: httpx.AsyncClient, data: Dataset, rng: random.Random) -> httpx.Response:
+    return await client.get("/api/admin/stats")
+
+
+async def login_burst_scenario(client: httpx.AsyncClient, data: Dataset, rng: random.Random) -> httpx.Response:
+    # Everyone logging in at once on a Monday morning
+    return await client.post("/api/auth/login", json={"email": rng.choice(data.users), "password": SEED_PASSWORD})
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "heartbeats": heartbeat_scenario,
+    "dashboard": dashboard_scenario,
+    "catalogue": catalogue_scenario,
+    "videos": videos_scenario,
+    "admin_stats": admin_stats_scenario,
+    "login_burst": login_burst_scenario,
+}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(target: Target, scenario: Scenario, data: Dataset, requests: int,
+                       concurrency: int, rng: random.Random) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            started = time.perf_counter()
+            try:
+                response = await scenario(target.client, data, rng)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    ops_before = target.db_ops() if target.db_ops else None
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    ops = target.db_ops() - ops_before if target.db_ops else None
+
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if not status.startswith(("2", "3")))
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "duration_seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1) if elapsed else 0.0,
+        "errors": errors,
+        "statuses": statuses,
+        "latency_ms": {
+            "min": round(latencies[0], 3) if latencies else 0.0,
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            "p50": round(percentile(latencies, 0.50), 3),
+            "p95": round(percentile(latencies, 0.95), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "max": round(latencies[-1], 3) if latencies else 0.0,
+        },
+        "db_ops_per_request": round(ops / requests, 2) if ops is not None and requests else None,
+    }
+
+
+async def run_load_test(options: Dict[str, Any]) -> Dict[str, Any]:
+    rng = random.Random(options["seed"])
+    if options["base_url"]:
+        target = http_target(options["base_url"], options["timeout"], options["concurrency"])
+    else:
+        target = await in_process_target(options["backend"], options["timeout"])
+
+    try:
+        seed_started = time.perf_counter()
+        data = await seed_dataset(target.client, options["users"], options["videos"], options["progress"],
+                                  options["concurrency"], rng)
+        typer.echo(f"🌱 Seeded {len(data.users)} users, {len(data.videos)} videos and "
+                   f"{options['progress']} progress records in {time.perf_counter() - seed_started:.1f}s")
+
+        results = {}
+        for name in options["scenarios"]:
+            results[name] = await run_scenario(target, SCENARIOS[name], data, options["requests"],
+                                               options["concurrency"], rng)
+            summary = results[name]
+            typer.echo(
+                f"{name:<14} {summary['throughput_rps']:>9.1f} req/s  "
+                f"p50 {summary['latency_ms']['p50']:>8.2f} ms  p95 {summary['latency_ms']['p95']:>8.2f} ms  "
+                f"p99 {summary['latency_ms']['p99']:>8.2f} ms  errors {summary['errors']}"
+                + (f"  db ops/req {summary['db_ops_per_request']}" if summary["db_ops_per_request"] is not None else "")
+            )
+    finally:
+        await target.close()
+
+    return {
+        "generated_at": datetime.utcnow().isoformat(),
+        "config": {key: value for key, value in options.items() if key != "output"},
+        "scenarios": results,
+    }
+
+
+@cli.command()
+def main(
+    base_url: Optional[str] = typer.Option(None, help="Run against a live server instead of in-process"),
+    backend: str = typer.Option("memory", help="Storage backend for in-process runs: memory or mongo"),
+    scenario: List[str] = typer.Option(list(SCENARIOS), help="Scenario to run (repeatable)"),
+    users: int = typer.Option(50, help="Users to seed"),
+    videos: int = typer.Option(100, help="Videos to seed"),
+    progress: int = typer.Option(2000, help="Progress records to seed"),
+    requests: int = typer.Option(1000, help="Requests per scenario"),
+    concurrency: int = typer.Option(20, help="Concurrent clients"),
+    timeout: float = typer.Option(30.0, help="Per-request timeout in seconds"),
+    seed: int = typer.Option(42, help="Random seed for the dataset and request mix"),
+    output: Optional[str] = typer.Option(None, help="Write the results as JSON to this file"),
+):
+    """Seed a dataset and run the selected scenarios."""
+    unknown = [name for name in scenario if name not in SCENARIOS]
+    if unknown:
+        raise typer.BadParameter(f"Unknown scenario(s): {', '.join(unknown)}. Available: {', '.join(SCENARIOS)}")
+    if backend not in ("memory", "mongo"):
+        raise typer.BadParameter("backend must be 'memory' or 'mongo'")
+
+    options = {
+        "base_url": base_url,
+        "backend": None if base_url else backend,
+        "scenarios": scenario,
+        "users": users,
+        "videos": videos,
+        "progress": progress,
+        "requests": requests,
+        "concurrency": concurrency,
+        "timeout": timeout,
+        "seed": seed,
+        "output": output,
+    }
+    results = asyncio.run(run_load_test(options))
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        typer.echo(f"📄 Results written to {output}")
+
+
+if __name__ == "__main__":
+    cli()
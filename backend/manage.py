@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Maintenance commands for the Real Estate Training Platform backend.
+
+Run from the backend directory, e.g. ``python manage.py rebuild-video-stats``.
+"""
+import asyncio
+from collections import Counter
+
+import typer
+from pymongo import monitoring
+
+import server
+
+cli = typer.Typer(help="Maintenance commands for the training platform backend")
+
+
+@cli.callback()
+def main():
+    """Maintenance commands for the training platform backend."""
+
+
+async def _connect():
+    server.client, server.db = await server.init_db()
+
+
+@cli.command("rebuild-video-stats")
+def rebuild_video_stats():
+    """Recompute the video_stats collection from scratch out of video_progress."""
+    async def run() -> bool:
+        await _connect()
+        if server.client is None:
+            # init_db() fell back to the in-memory store, which this process would discard
+            typer.echo("❌ MongoDB is not reachable; video_stats was not rebuilt")
+            return False
+        rebuilt = await server.rebuild_video_stats()
+        typer.echo(f"✅ video_stats rebuilt for {rebuilt} videos")
+        server.client.close()
+        return True
+
+    if not asyncio.run(run()):
+        raise typer.Exit(code=1)
+
+
+class _ServedBy(monitoring.CommandListener):
+    """Records which server each find command was sent to."""
+
+    def __init__(self):
+        self.finds = Counter()
+
+    def started(self, event):
+        if event.command_name == "find":
+            host, port = event.connection_id
+            self.finds[f"{host}:{port}"] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+@cli.command("check-read-routing")
+def check_read_routing(samples: int = typer.Option(10, help="Reads to issue per endpoint class")):
+    """Show which replica set members serve primary and analytics reads.
+
+    Needs a replica set. A local three-node one for testing:
+
+        mongod --replSet rs0 --port 27017 --dbpath /tmp/rs0-0 (likewise 27018, 27019)
+        mongosh --eval 'rs.initiate({_id: "rs0", members: [
+            {_id: 0, host: "localhost:27017"}, {_id: 1, host: "localhost:27018"},
+            {_id: 2, host: "localhost:27019"}]})'
+        MONGO_URL="mongodb://localhost:27017,localhost:27018,localhost:27019/?replicaSet=rs0" \
+            python manage.py check-read-routing
+    """
+    async def run() -> bool:
+        served_by = _ServedBy()
+        monitoring.register(served_by)
+        await _connect()
+        if server.client is None:
+            typer.echo("❌ MongoDB is not reachable; read routing only applies to a replica set")
+            return False
+
+        primary = server.client.primary
+        primary = f"{primary[0]}:{primary[1]}" if primary else None
+        secondaries = sorted(f"{host}:{port}" for host, port in server.client.secondaries)
+        typer.echo(f"Primary: {primary or 'none'}")
+        typer.echo(f"Secondaries: {', '.join(secondaries) or 'none'}")
+
+        results = {}
+        for label, collection in (
+            ("primary", server.db.get_collection("categories")),
+            ("analytics", server.analytics_collection("categories")),
+        ):
+            served_by.finds.clear()
+            for _ in range(samples):
+                await collection.find_one({})
+            results[label] = dict(served_by.finds)
+            typer.echo(f"{label} reads ({collection.read_preference}): {results[label]}")
+
+        ok = set(results["primary"]) <= {primary}
+        if not ok:
+            typer.echo("❌ Primary reads were served by another member")
+        mode = server.analytics_read_preference_mode
+        if mode in ("secondary", "secondaryPreferred") and secondaries and primary in results["analytics"]:
+            typer.echo("❌ Analytics reads reached the primary although secondaries are available")
+            ok = False
+        if ok:
+            typer.echo("✅ Read routing matches the configured policy")
+        server.client.close()
+        return ok
+
+    if not asyncio.run(run()):
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,1104 @@
+"""In-memory storage engine implementing the subset of the Motor API used by server.py.
+
+Used when STORAGE_BACKEND=memory or when MongoDB cannot be reached. Supports query
+filters, the $set/$inc/$max/$min/$setOnInsert/$unset update operators, upserts,
+projections, sort/skip/limit, bulk writes, the aggregation stages the server uses,
+and unique/non-unique hash indexes so equality lookups on indexed fields are O(1).
+TTL expiry (expireAfterSeconds on an index or a time-series collection) runs at most
+once a minute, like mongod's TTL monitor.
+
+All operations complete synchronously inside their coroutine, so each one is atomic
+with respect to other tasks on the event loop.
+"""
+import math
+import re
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, OperationFailure
+
+_MISSING = object()
+
+TTL_MONITOR_INTERVAL_SECONDS = 60
+
+
+# Document helpers
+
+def _copy(value):
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    return value
+
+
+def _get_path(doc, path: str, default=_MISSING):
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list):
+            # "items.field" on an array collects the field of every element
+            value = [item.get(part) for item in value if isinstance(item, dict) and part in item]
+        else:
+            return default
+        if value is _MISSING:
+            return default
+    return value
+
+
+def _set_path(doc: dict, path: str, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset_path(doc: dict, path: str):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def _type_rank(value) -> int:
+    # Simplified BSON comparison order: null < numbers < strings < objects < arrays < bool < dates
+    if value is None or value is _MISSING:
+        return 0
+    if isinstance(value, bool):
+        return 5
+    if isinstance(value, (int, float)):
+        return 1
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, dict):
+        return 3
+    if isinstance(value, list):
+        return 4
+    if isinstance(value, datetime):
+        return 6
+    return 7
+
+
+def _sort_key(value):
+    rank = _type_rank(value)
+    if rank == 0:
+        return (0, 0)
+    if rank in (3, 4, 7):
+        return (rank, str(value))
+    return (rank, value)
+
+
+def _compare(a, b) -> int:
+    ka, kb = _sort_key(a), _sort_key(b)
+    return (ka > kb) - (ka < kb)
+
+
+def _hashable(value):
+    if isinstance(value, dict):
+        return tuple((k, _hashable(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(_hashable(v) for v in value)
+    return value
+
+
+# Query matching
+
+def _match_operator(value, operator: str, operand) -> bool:
+    if operator == "$eq":
+        return _values_equal(value, operand)
+    if operator == "$ne":
+        return not _values_equal(value, operand)
+    if operator == "$in":
+        return any(_values_equal(value, candidate) for candidate in operand)
+    if operator == "$nin":
+        return not any(_values_equal(value, candidate) for candidate in operand)
+    if operator == "$exists":
+        return (value is not _MISSING) == bool(operand)
+    if operator in ("$gt", "$gte", "$lt", "$lte"):
+        if value is _MISSING or value is None or _type_rank(value) != _type_rank(operand):
+            return False
+        result = _compare(value, operand)
+        return {"$gt": result > 0, "$gte": result >= 0, "$lt": result < 0, "$lte": result <= 0}[operator]
+    if operator == "$regex":
+        return isinstance(value, str) and re.search(operand, value) is not None
+    if operator == "$not":
+        return not _match_condition(value, operand)
+    raise OperationFailure(f"Unsupported query operator {operator}")
+
+
+def _values_equal(value, operand) -> bool:
+    if value is _MISSING:
+        return operand is None
+    if isinstance(value, list) and not isinstance(operand, list):
+        return operand in value
+    return value == operand
+
+
+def _match_condition(value, condition) -> bool:
+    if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+        return all(_match_operator(value, op, operand) for op, operand in condition.items() if op != "$options")
+    return _values_equal(value, condition)
+
+
+def matches(doc: dict, query: Optional[dict]) -> bool:
+    if not query:
+        return True
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$expr":
+            if not _truthy(evaluate(condition, doc)):
+                return False
+        elif not _match_condition(_get_path(doc, key), condition):
+            return False
+    return True
+
+
+def _equality_value(condition):
+    """Value(s) an indexable condition pins a field to, or _MISSING if it is not one."""
+    if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+        if set(condition) == {"$eq"}:
+            return [condition["$eq"]]
+        if set(condition) == {"$in"}:
+            return list(condition["$in"])
+        return _MISSING
+    return [condition]
+
+
+# Aggregation expressions
+
+def _truthy(value) -> bool:
+    return value not in (None, False, 0, _MISSING)
+
+
+def _numeric(values: Iterable) -> List[float]:
+    return [v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool)]
+
+
+def evaluate(expr, doc, variables: Optional[Dict[str, Any]] = None):
+    variables = variables or {}
+    if isinstance(expr, str):
+        if expr.startswith("$$"):
+            name, _, path = expr[2:].partition(".")
+            base = doc if name in ("ROOT", "CURRENT") else variables.get(name)
+            value = _get_path(base, path) if path else base
+            return None if value is _MISSING else value
+        if expr.startswith("$"):
+            value = _get_path(doc, expr[1:])
+            return None if value is _MISSING else value
+        return expr
+    if isinstance(expr, list):
+        return [evaluate(item, doc, variables) for item in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if len(expr) == 1:
+        operator, args = next(iter(expr.items()))
+        if operator.startswith("$"):
+            return _evaluate_operator(operator, args, doc, variables)
+    return {key: evaluate(value, doc, variables) for key, value in expr.items()}
+
+
+_DATE_PARTS = {"$year": "year", "$month": "month", "$dayOfMonth": "day", "$hour": "hour", "$minute": "minute"}
+
+
+def _evaluate_operator(operator: str, args, doc, variables):
+    def arg_values():
+        values = args if isinstance(args, list) else [args]
+        return [evaluate(value, doc, variables) for value in values]
+
+    if operator == "$literal":
+        return args
+    if operator == "$cond":
+        if isinstance(args, dict):
+            condition, then, otherwise = args["if"], args["then"], args["else"]
+        else:
+            condition, then, otherwise = args
+        return evaluate(then if _truthy(evaluate(condition, doc, variables)) else otherwise, doc, variables)
+    if operator == "$ifNull":
+        values = arg_values()
+        return next((value for value in values[:-1] if value is not None), values[-1])
+    if operator == "$filter":
+        items = evaluate(args["input"], doc, variables) or []
+        name = args.get("as", "this")
+        return [item for item in items if _truthy(evaluate(args["cond"], doc, {**variables, name: item}))]
+    if operator == "$map":
+        items = evaluate(args["input"], doc, variables) or []
+        name = args.get("as", "this")
+        return [evaluate(args["in"], doc, {**variables, name: item}) for item in items]
+
+    values = arg_values()
+    if operator == "$size":
+        return len(values[0] or [])
+    if operator in ("$sum", "$max", "$min", "$avg"):
+        items = values[0] if len(values) == 1 and isinstance(values[0], list) else values
+        numbers = _numeric(items) if operator in ("$sum", "$avg") else [v for v in items if v is not None]
+        if operator == "$sum":
+            return sum(numbers)
+        if operator == "$avg":
+            return sum(numbers) / len(numbers) if numbers else None
+        if not numbers:
+            return None
+        return max(numbers, key=_sort_key) if operator == "$max" else min(numbers, key=_sort_key)
+    if operator == "$add":
+        if any(isinstance(v, datetime) for v in values):
+            base = next(v for v in values if isinstance(v, datetime))
+            return base + timedelta(milliseconds=sum(_numeric(values)))
+        return sum(_numeric(values))
+    if operator == "$subtract":
+        a, b = values
+        if isinstance(a, datetime) and isinstance(b, datetime):
+            return int((a - b).total_seconds() * 1000)
+        return None if a is None or b is None else a - b
+    if operator == "$multiply":
+        return math.prod(values) if None not in values else None
+    if operator == "$divide":
+        a, b = values
+        return None if a is None or b is None else a / b
+    if operator == "$exp":
+        return None if values[0] is None else math.exp(values[0])
+    if operator in _DATE_PARTS:
+        return None if values[0] is None else getattr(values[0], _DATE_PARTS[operator])
+    if operator == "$toLong":
+        value = values[0]
+        if isinstance(value, datetime):
+            return int((value - datetime(1970, 1, 1)).total_seconds() * 1000)
+        return None if value is None else int(value)
+    if operator in ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte"):
+        result = _compare(values[0], values[1])
+        return {"$eq": result == 0, "$ne": result != 0, "$gt": result > 0,
+                "$gte": result >= 0, "$lt": result < 0, "$lte": result <= 0}[operator]
+    if operator == "$and":
+        return all(_truthy(v) for v in values)
+    if operator == "$or":
+        return any(_truthy(v) for v in values)
+    if operator == "$not":
+        return not _truthy(values[0])
+    if operator == "$in":
+        return values[0] in (values[1] or [])
+    raise OperationFailure(f"Unsupported aggregation expression {operator}")
+
+
+_ACCUMULATORS = {"$sum", "$avg", "$max", "$min", "$first", "$last", "$push", "$addToSet", "$count"}
+
+
+def _accumulate(operator: str, values: List[Any]):
+    if operator == "$sum":
+        return sum(_numeric(values))
+    if operator == "$avg":
+        numbers = _numeric(values)
+        return sum(numbers) / len(numbers) if numbers else None
+    if operator in ("$max", "$min"):
+        present = [v for v in values if v is not None]
+        if not present:
+            return None
+        return max(present, key=_sort_key) if operator == "$max" else min(present, key=_sort_key)
+    if operator == "$first":
+        return values[0] if values else None
+    if operator == "$last":
+        return values[-1] if values else None
+    if operator == "$push":
+        return list(values)
+    if operator == "$addToSet":
+        seen, result = set(), []
+        for value in values:
+            key = _hashable(value)
+            if key not in seen:
+                seen.add(key)
+                result.append(value)
+        return result
+    if operator == "$count":
+        return len(values)
+    raise OperationFailure(f"Unsupported accumulator {operator}")
+
+
+# Projection
+
+def project(doc: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return _copy(doc)
+    include_id = projection.get("_id", 1)
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    inclusive = any(_truthy(value) for value in fields.values())
+    if inclusive:
+        result = {}
+        if _truthy(include_id) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        for path, flag in fields.items():
+            if not _truthy(flag):
+                continue
+            value = _get_path(doc, path)
+            if value is not _MISSING:
+                _set_path(result, path, _copy(value))
+        return result
+    result = _copy(doc)
+    for path in fields:
+        _unset_path(result, path)
+    if not _truthy(include_id):
+        result.pop("_id", None)
+    return result
+
+
+def _project_stage(doc: dict, spec: dict) -> dict:
+    include_id = spec.get("_id", 1)
+    fields = {key: value for key, value in spec.items() if key != "_id"}
+    if all(value in (0, False) for value in fields.values()) and (fields or include_id in (0, False)):
+        # Exclusion, including a bare {"_id": 0}
+        return project(doc, spec)
+    result = {}
+    if include_id in (1, True) and "_id" in doc:
+        result["_id"] = doc["_id"]
+    elif include_id not in (0, False, 1, True):
+        result["_id"] = evaluate(include_id, doc)
+    for path, value in fields.items():
+        if value in (1, True):
+            current = _get_path(doc, path)
+            if current is not _MISSING:
+                _set_path(result, path, _copy(current))
+        else:
+            _set_path(result, path, evaluate(value, doc))
+    return result
+
+
+# Updates
+
+def _apply_update(doc: dict, update: dict, inserting: bool) -> bool:
+    """Apply update operators in place. Returns True if the document changed."""
+    before = _copy(doc)
+    for operator, fields in update.items():
+        if operator == "$setOnInsert" and not inserting:
+            continue
+        for path, value in fields.items():
+            current = _get_path(doc, path)
+            if operator in ("$set", "$setOnInsert"):
+                _set_path(doc, path, _copy(value))
+            elif operator == "$unset":
+                _unset_path(doc, path)
+            elif operator == "$inc":
+                _set_path(doc, path, (0 if current in (_MISSING, None) else current) + value)
+            elif operator == "$max":
+                if current in (_MISSING, None) or _compare(value, current) > 0:
+                    _set_path(doc, path, value)
+            elif operator == "$min":
+                if current in (_MISSING, None) or _compare(value, current) < 0:
+                    _set_path(doc, path, value)
+            elif operator == "$push":
+                _set_path(doc, path, (current if isinstance(current, list) else []) + [_copy(value)])
+            else:
+                raise OperationFailure(f"Unsupported update operator {operator}")
+    return doc != before
+
+
+def _upsert_seed(query: dict) -> dict:
+    """Fields an upsert copies from the filter into the new document."""
+    doc = {}
+    for key, condition in (query or {}).items():
+        if key.startswith("$"):
+            if key == "$and":
+                for sub in condition:
+                    doc.update(_upsert_seed(sub))
+            continue
+        values = _equality_value(condition)
+        if values is not _MISSING and len(values) == 1:
+            _set_path(doc, key, _copy(values[0]))
+    return doc
+
+
+# Results
+
+class InsertOneResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+        self.acknowledged = True
+
+
+class InsertManyResult:
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+        self.acknowledged = True
+
+
+class UpdateResult:
+    def __init__(self, matched_count: int, modified_count: int, upserted_id=None):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_id = upserted_id
+        self.acknowledged = True
+
+
+class DeleteResult:
+    def __init__(self, deleted_count: int):
+        self.deleted_count = deleted_count
+        self.acknowledged = True
+
+
+class BulkWriteResult:
+    def __init__(self, details: dict):
+        self.bulk_api_result = details
+        self.inserted_count = details["nInserted"]
+        self.matched_count = details["nMatched"]
+        self.modified_count = details["nModified"]
+        self.deleted_count = details["nRemoved"]
+        self.upserted_count = details["nUpserted"]
+        self.upserted_ids = {entry["index"]: entry["_id"] for entry in details["upserted"]}
+        self.acknowledged = True
+
+
+# Cursors
+
+class InMemoryCursor:
+    """Lazy cursor: filtering, sorting and slicing happen when results are read."""
+
+    def __init__(self, produce):
+        self._produce = produce
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+        self._results = None
+
+    def sort(self, key_or_list, direction=None):
+        if isinstance(key_or_list, str):
+            self._sort = [(key_or_list, direction or 1)]
+        else:
+            self._sort = list(key_or_list)
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def _materialize(self) -> List[dict]:
+        if self._results is None:
+            docs = self._produce(self._sort, self._skip, self._limit)
+            self._results = iter(docs)
+        return self._results
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        results = self._materialize()
+        if length is None:
+            return list(results)
+        return [doc for _, doc in zip(range(length), results)]
+
+    def __aiter__(self):
+        self._materialize()
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._materialize())
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def _sort_docs(docs: List[dict], sort: List[Tuple[str, int]]) -> List[dict]:
+    # Apply the least significant key first; Python's sort is stable
+    for field, direction in reversed(sort):
+        docs.sort(key=lambda doc: _sort_key(_get_path(doc, field)), reverse=direction < 0)
+    return docs
+
+
+# Collections
+
+class _HashIndex:
+    def __init__(self, name: str, fields: List[Tuple[str, int]], unique: bool):
+        self.name = name
+        self.fields = [field for field, _ in fields]
+        self.key = list(fields)
+        self.unique = unique
+        # One map per key prefix so a compound index also serves its leading fields
+        self.maps: List[Dict[tuple, set]] = [{} for _ in self.fields]
+
+    def _values(self, doc: dict) -> tuple:
+        values = []
+        for field in self.fields:
+            value = _get_path(doc, field)
+            values.append(None if value is _MISSING else _hashable(value))
+        return tuple(values)
+
+    def add(self, doc_id: int, doc: dict):
+        values = self._values(doc)
+        for depth, index_map in enumerate(self.maps):
+            index_map.setdefault(values[:depth + 1], set()).add(doc_id)
+
+    def remove(self, doc_id: int, doc: dict):
+        values = self._values(doc)
+        for depth, index_map in enumerate(self.maps):
+            bucket = index_map.get(values[:depth + 1])
+            if bucket is not None:
+                bucket.discard(doc_id)
+                if not bucket:
+                    del index_map[values[:depth + 1]]
+
+    def conflict(self, doc: dict, doc_id: Optional[int]) -> bool:
+        if not self.unique:
+            return False
+        holders = self.maps[-1].get(self._values(doc), set())
+        return any(holder != doc_id for holder in holders)
+
+
+class InMemoryCollection:
+    def __init__(self, database: "InMemoryDatabase", name: str):
+        self.database = database
+        self.name = name
+        self._docs: Dict[int, dict] = {}
+        self._next_id = 0
+        self._indexes: Dict[str, _HashIndex] = {"_id_": _HashIndex("_id_", [("_id", 1)], unique=True)}
+        # (field, seconds) when documents expire, the TTL index and when expiry last ran
+        self._ttl: Optional[Tuple[str, float]] = None
+        self._ttl_index: Optional[str] = None
+        self._ttl_checked = 0.0
+        # Options given to create_collection, as listCollections reports them
+        self.options: Dict[str, Any] = {}
+
+    def __repr__(self):
+        return f"InMemoryCollection({self.name!r})"
+
+    def _count(self, command: str):
+        self.database.commands[(self.name, command)] += 1
+        for observer in self.database.observers:
+            observer(self.name, command)
+        if self._ttl is not None:
+            self._expire()
+
+    def _expire(self):
+        now = time.monotonic()
+        if now - self._ttl_checked < TTL_MONITOR_INTERVAL_SECONDS:
+            return
+        self._ttl_checked = now
+        field, seconds = self._ttl
+        cutoff = datetime.utcnow() - timedelta(seconds=seconds)
+        for doc_id, doc in list(self._docs.items()):
+            value = doc.get(field)
+            if isinstance(value, datetime) and value < cutoff:
+                self._index_remove(doc_id, doc)
+                del self._docs[doc_id]
+
+    # Index maintenance
+
+    def _index_add(self, doc_id: int, doc: dict):
+        for index in self._indexes.values():
+            index.add(doc_id, doc)
+
+    def _index_remove(self, doc_id: int, doc: dict):
+        for index in self._indexes.values():
+            index.remove(doc_id, doc)
+
+    def _check_unique(self, doc: dict, doc_id: Optional[int] = None):
+        for index in self._indexes.values():
+            if index.conflict(doc, doc_id):
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error collection: {self.name} index: {index.name}", 11000
+                )
+
+    def _candidate_ids(self, query: Optional[dict]) -> Iterable[int]:
+        """Narrow a query to the documents an index can pin it to, if any."""
+        if query:
+            best = None
+            for index in self._indexes.values():
+                pinned = []
+                for field in index.fields:
+                    if field not in query:
+                        break
+                    values = _equality_value(query[field])
+                    if values is _MISSING:
+                        break
+                    pinned.append(values)
+                if pinned and (best is None or len(pinned) > len(best[1])):
+                    best = (index, pinned)
+            if best is not None:
+                index, pinned = best
+                index_map = index.maps[len(pinned) - 1]
+                combos = [()]
+                for values in pinned:
+                    combos = [combo + (_hashable(value),) for combo in combos for value in values]
+                ids = set()
+                for combo in combos:
+                    ids |= index_map.get(combo, set())
+                return sorted(ids)
+        return list(self._docs)
+
+    def _matching(self, query: Optional[dict]) -> List[Tuple[int, dict]]:
+        return [
+            (doc_id, self._docs[doc_id])
+            for doc_id in self._candidate_ids(query)
+            if doc_id in self._docs and matches(self._docs[doc_id], query)
+        ]
+
+    def _insert(self, doc: dict) -> Any:
+        return self._docs[self._insert_doc(doc)]["_id"]
+
+    def _insert_doc(self, doc: dict) -> int:
+        doc = _copy(doc)
+        doc.setdefault("_id", ObjectId())
+        self._check_unique(doc)
+        doc_id = self._next_id
+        self._next_id += 1
+        self._docs[doc_id] = doc
+        self._index_add(doc_id, doc)
+        return doc_id
+
+    def _replace_doc(self, doc_id: int, new_doc: dict):
+        self._check_unique(new_doc, doc_id)
+        self._index_remove(doc_id, self._docs[doc_id])
+        self._docs[doc_id] = new_doc
+        self._index_add(doc_id, new_doc)
+
+    def _update(self, query: dict, update: dict, upsert: bool, multi: bool) -> UpdateResult:
+        if not any(key.startswith("$") for key in update):
+            raise OperationFailure("update only works with $ operators")
+        targets = self._matching(query)
+        if not multi:
+            targets = targets[:1]
+        if not targets:
+            if not upsert:
+                return UpdateResult(0, 0)
+            doc = _upsert_seed(query)
+            _apply_update(doc, update, inserting=True)
+            return UpdateResult(0, 0, upserted_id=self._insert(doc))
+        modified = 0
+        for doc_id, doc in targets:
+            new_doc = _copy(doc)
+            if _apply_update(new_doc, update, inserting=False):
+                self._replace_doc(doc_id, new_doc)
+                modified += 1
+        return UpdateResult(len(targets), modified)
+
+    # Motor API
+
+    def find(self, filter: Optional[dict] = None, projection: Optional[dict] = None, *args, **kwargs) -> InMemoryCursor:
+        self._count("find")
+        projection = projection or kwargs.get("projection")
+
+        def produce(sort, skip, limit):
+            docs = [doc for _, doc in self._matching(filter)]
+            if sort:
+                docs = _sort_docs(list(docs), sort)
+            docs = docs[skip:]
+            if limit:
+                docs = docs[:limit]
+            return [project(doc, projection) for doc in docs]
+
+        cursor = InMemoryCursor(produce)
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        if kwargs.get("limit"):
+            cursor.limit(kwargs["limit"])
+        return cursor
+
+    async def find_one(self, filter: Optional[dict] = None, projection: Optional[dict] = None, *args, **kwargs):
+        self._count("find")
+        found = self._matching(filter)
+        if kwargs.get("sort"):
+            found = [(None, doc) for doc in _sort_docs([doc for _, doc in found], kwargs["sort"])]
+        return project(found[0][1], projection) if found else None
+
+    async def insert_one(self, document: dict, *args, **kwargs) -> InsertOneResult:
+        self._count("insert")
+        inserted_id = self._insert(document)
+        document.setdefault("_id", inserted_id)
+        return InsertOneResult(inserted_id)
+
+    async def insert_many(self, documents: List[dict], ordered: bool = True, *args, **kwargs) -> InsertManyResult:
+        self._count("insert")
+        result = self._bulk_write([InsertOne(document) for document in documents], ordered)
+        return InsertManyResult([document.get("_id") for document in documents][:result.inserted_count])
+
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False, *args, **kwargs) -> UpdateResult:
+        self._count("update")
+        return self._update(filter, update, upsert, multi=False)
+
+    async def update_many(self, filter: dict, update: dict, upsert: bool = False, *args, **kwargs) -> UpdateResult:
+        self._count("update")
+        return self._update(filter, update, upsert, multi=True)
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, *args, **kwargs) -> UpdateResult:
+        self._count("update")
+        return self._replace(filter, replacement, upsert)
+
+    def _replace(self, filter: dict, replacement: dict, upsert: bool) -> UpdateResult:
+        targets = self._matching(filter)[:1]
+        if not targets:
+            if not upsert:
+                return UpdateResult(0, 0)
+            return UpdateResult(0, 0, upserted_id=self._insert(replacement))
+        doc_id, doc = targets[0]
+        new_doc = _copy(replacement)
+        new_doc["_id"] = doc["_id"]
+        self._replace_doc(doc_id, new_doc)
+        return UpdateResult(1, int(new_doc != doc))
+
+    async def find_one_and_update(
+        self,
+        filter: dict,
+        update: dict,
+        projection: Optional[dict] = None,
+        sort=None,
+        upsert: bool = False,
+        return_document: bool = ReturnDocument.BEFORE,
+        *args,
+        **kwargs
+    ):
+        self._count("findAndModify")
+        targets = self._matching(filter)
+        if sort:
+            sorted_docs = _sort_docs([doc for _, doc in targets], list(sort))
+            targets = [next(pair for pair in targets if pair[1] is doc) for doc in sorted_docs]
+        if not targets:
+            if not upsert:
+                return None
+            doc = _upsert_seed(filter)
+            _apply_update(doc, update, inserting=True)
+            doc_id = self._insert_doc(doc)
+            return project(self._docs[doc_id], projection) if return_document == ReturnDocument.AFTER else None
+        doc_id, doc = targets[0]
+        new_doc = _copy(doc)
+        _apply_update(new_doc, update, inserting=False)
+        self._replace_doc(doc_id, new_doc)
+        return project(new_doc if return_document == ReturnDocument.AFTER else doc, projection)
+
+    async def delete_one(self, filter: dict, *args, **kwargs) -> DeleteResult:
+        self._count("delete")
+        return self._delete(filter, multi=False)
+
+    async def delete_many(self, filter: dict, *args, **kwargs) -> DeleteResult:
+        self._count("delete")
+        return self._delete(filter, multi=True)
+
+    def _delete(self, filter: dict, multi: bool) -> DeleteResult:
+        targets = self._matching(filter)
+        if not multi:
+            targets = targets[:1]
+        for doc_id, doc in targets:
+            self._index_remove(doc_id, doc)
+            del self._docs[doc_id]
+        return DeleteResult(len(targets))
+
+    async def count_documents(self, filter: dict, limit: Optional[int] = None, skip: int = 0, *args, **kwargs) -> int:
+        self._count("aggregate")
+        count = max(len(self._matching(filter)) - skip, 0)
+        return min(count, limit) if limit else count
+
+    async def estimated_document_count(self, *args, **kwargs) -> int:
+        self._count("count")
+        return len(self._docs)
+
+    async def bulk_write(self, requests: List[Any], ordered: bool = True, *args, **kwargs) -> BulkWriteResult:
+        self._count("bulkWrite")
+        return self._bulk_write(requests, ordered)
+
+    def _bulk_write(self, requests: List[Any], ordered: bool) -> BulkWriteResult:
+        details = {"nInserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "nUpserted": 0,
+                   "upserted": [], "writeErrors": [], "writeConcernErrors": []}
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    request._doc.setdefault("_id", self._insert(request._doc))
+                    details["nInserted"] += 1
+                    continue
+                if isinstance(request, (UpdateOne, UpdateMany)):
+                    result = self._update(request._filter, request._doc, bool(request._upsert),
+                                          multi=isinstance(request, UpdateMany))
+                elif isinstance(request, ReplaceOne):
+                    result = self._replace(request._filter, request._doc, bool(request._upsert))
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    details["nRemoved"] += self._delete(request._filter, multi=isinstance(request, DeleteMany)).deleted_count
+                    continue
+                else:
+                    raise OperationFailure(f"Unsupported bulk operation {type(request).__name__}")
+                details["nMatched"] += result.matched_count
+                details["nModified"] += result.modified_count
+                if result.upserted_id is not None:
+                    details["nUpserted"] += 1
+                    details["upserted"].append({"index": index, "_id": result.upserted_id})
+            except DuplicateKeyError as e:
+                details["writeErrors"].append({"index": index, "code": 11000, "errmsg": str(e), "op": request._doc})
+                if ordered:
+                    break
+        if details["writeErrors"]:
+            raise BulkWriteError(details)
+        return BulkWriteResult(details)
+
+    def aggregate(self, pipeline: List[dict], *args, **kwargs) -> InMemoryCursor:
+        self._count("aggregate")
+
+        def produce(sort, skip, limit):
+            stages = list(pipeline)
+            # A leading $match can use the collection's indexes
+            if stages and "$match" in stages[0]:
+                docs = [_copy(doc) for _, doc in self._matching(stages.pop(0)["$match"])]
+            else:
+                docs = [_copy(doc) for doc in self._docs.values()]
+            docs = self.database._run_pipeline(docs, stages)
+            if sort:
+                docs = _sort_docs(docs, sort)
+            docs = docs[skip:]
+            return docs[:limit] if limit else docs
+
+        return InMemoryCursor(produce)
+
+    async def create_index(self, keys, name: Optional[str] = None, unique: bool = False,
+                           expireAfterSeconds: Optional[float] = None, **kwargs) -> str:
+        self._count("createIndexes")
+        fields = [(keys, 1)] if isinstance(keys, str) else list(keys)
+        name = name or "_".join(f"{field}_{direction}" for field, direction in fields)
+        if expireAfterSeconds is not None:
+            self._ttl = (fields[0][0], expireAfterSeconds)
+            self._ttl_index = name
+        if name in self._indexes:
+            return name
+        index = _HashIndex(name, fields, unique)
+        for doc_id, doc in self._docs.items():
+            if index.conflict(doc, doc_id):
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: {name}", 11000)
+            index.add(doc_id, doc)
+        self._indexes[name] = index
+        return name
+
+    async def create_indexes(self, indexes: List[Any], *args, **kwargs) -> List[str]:
+        names = []
+        for model in indexes:
+            document = model.document
+            names.append(await self.create_index(
+                list(document["key"].items()),
+                name=document.get("name"),
+                unique=document.get("unique", False),
+                expireAfterSeconds=document.get("expireAfterSeconds")
+            ))
+        return names
+
+    async def index_information(self) -> Dict[str, Any]:
+        info = {}
+        for name, index in self._indexes.items():
+            info[name] = {"key": index.key, **({"unique": True} if index.unique and name != "_id_" else {})}
+            if name == self._ttl_index:
+                info[name]["expireAfterSeconds"] = self._ttl[1]
+        return info
+
+    async def drop(self):
+        self._docs.clear()
+        self._indexes = {"_id_": _HashIndex("_id_", [("_id", 1)], unique=True)}
+        self._ttl = None
+        self._ttl_index = None
+
+
+# Database
+
+class InMemoryDatabase:
+    def __init__(self, name: str = "memory", observers: Optional[List[Callable[[str, str], None]]] = None):
+        self.name = name
+        self._collections: Dict[str, InMemoryCollection] = {}
+        # Number of operations issued per (collection, command), for benchmarking
+        self.commands: Counter = Counter()
+        # Called with (collection, command) for every operation, like a command listener
+        self.observers = list(observers or [])
+
+    def __getitem__(self, name: str) -> InMemoryCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = InMemoryCollection(self, name)
+        return collection
+
+    def __getattr__(self, name: str) -> InMemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def get_collection(self, name: str, *args, **kwargs) -> InMemoryCollection:
+        return self[name]
+
+    async def list_collection_names(self, *args, **kwargs) -> List[str]:
+        return list(self._collections)
+
+    async def list_collections(self, filter: Optional[dict] = None, **kwargs) -> InMemoryCursor:
+        def produce(sort, skip, limit):
+            infos = [
+                {"name": name, "type": "timeseries" if "timeseries" in collection.options else "collection",
+                 "options": _copy(collection.options)}
+                for name, collection in self._collections.items()
+            ]
+            infos = [info for info in infos if matches(info, filter or {})]
+            return infos[skip:][:limit] if limit else infos[skip:]
+
+        return InMemoryCursor(produce)
+
+    async def create_collection(self, name: str, timeseries: Optional[dict] = None,
+                                expireAfterSeconds: Optional[float] = None, **kwargs) -> InMemoryCollection:
+        if name in self._collections:
+            raise CollectionInvalid(f"collection {name} already exists")
+        collection = self[name]
+        collection._count("create")
+        if timeseries:
+            collection.options["timeseries"] = dict(timeseries)
+            if expireAfterSeconds is not None:
+                collection.options["expireAfterSeconds"] = expireAfterSeconds
+                collection._ttl = (timeseries["timeField"], expireAfterSeconds)
+        return collection
+
+    async def command(self, command, *args, **kwargs):
+        name = command if isinstance(command, str) else next(iter(command))
+        if name == "ping":
+            return {"ok": 1.0}
+        if name == "collMod":
+            return self._coll_mod(args[0] if args else command[name], **kwargs)
+        raise OperationFailure(f"Unsupported command {name}")
+
+    def _coll_mod(self, name: str, expireAfterSeconds: Optional[float] = None, index: Optional[dict] = None, **kwargs):
+        collection = self._collections.get(name)
+        if collection is None:
+            raise OperationFailure(f"ns does not exist: {self.name}.{name}", 26)
+        collection._count("collMod")
+        if expireAfterSeconds is not None:
+            if "timeseries" not in collection.options:
+                raise OperationFailure("expireAfterSeconds is only supported on time-series collections")
+            collection.options["expireAfterSeconds"] = expireAfterSeconds
+            collection._ttl = (collection.options["timeseries"]["timeField"], expireAfterSeconds)
+        if index is not None:
+            if index.get("name") not in collection._indexes:
+                raise OperationFailure(f"cannot find index {index.get('name')}", 27)
+            if index["name"] != collection._ttl_index:
+                raise OperationFailure(f"no expireAfterSeconds field to update on index {index['name']}")
+            collection._ttl = (collection._ttl[0], index["expireAfterSeconds"])
+        return {"ok": 1.0}
+
+    # Aggregation pipeline
+
+    def _run_pipeline(self, docs: List[dict], stages: List[dict]) -> List[dict]:
+        for stage in stages:
+            (operator, spec), = stage.items()
+            docs = getattr(self, "_stage_" + operator[1:])(docs, spec)
+        return docs
+
+    def _stage_match(self, docs, spec):
+        return [doc for doc in docs if matches(doc, spec)]
+
+    def _stage_project(self, docs, spec):
+        return [_project_stage(doc, spec) for doc in docs]
+
+    def _stage_addFields(self, docs, spec):
+        result = []
+        for doc in docs:
+            doc = dict(doc)
+            for path, value in spec.items():
+                _set_path(doc, path, evaluate(value, doc))
+            result.append(doc)
+        return result
+
+    _stage_set = _stage_addFields
+
+    def _stage_unset(self, docs, spec):
+        fields = [spec] if isinstance(spec, str) else spec
+        return [project(doc, {field: 0 for field in fields}) for doc in docs]
+
+    def _stage_sort(self, docs, spec):
+        return _sort_docs(list(docs), list(spec.items()))
+
+    def _stage_limit(self, docs, spec):
+        return docs[:spec]
+
+    def _stage_skip(self, docs, spec):
+        return docs[spec:]
+
+    def _stage_count(self, docs, spec):
+        return [{spec: len(docs)}] if docs else []
+
+    def _stage_replaceRoot(self, docs, spec):
+        return [evaluate(spec["newRoot"], doc) for doc in docs]
+
+    def _stage_group(self, docs, spec):
+        groups: Dict[Any, Tuple[Any, List[dict]]] = {}
+        for doc in docs:
+            key = evaluate(spec["_id"], doc)
+            groups.setdefault(_hashable(key), (key, []))[1].append(doc)
+        result = []
+        for key, members in groups.values():
+            out = {"_id": key}
+            for field, accumulator in spec.items():
+                if field == "_id":
+                    continue
+                (operator, expr), = accumulator.items()
+                if operator not in _ACCUMULATORS:
+                    raise OperationFailure(f"Unsupported accumulator {operator}")
+                values = [evaluate(expr, member) for member in members] if operator != "$count" else members
+                if operator in ("$sum", "$avg"):
+                    # $sum over array-valued expressions is not an accumulator in MongoDB; ignore them
+                    values = [value for value in values if not isinstance(value, list)]
+                out[field] = _accumulate(operator, values)
+            result.append(out)
+        return result
+
+    def _stage_unwind(self, docs, spec):
+        if isinstance(spec, str):
+            spec = {"path": spec}
+        path = spec["path"][1:]
+        preserve = spec.get("preserveNullAndEmptyArrays", False)
+        result = []
+        for doc in docs:
+            value = _get_path(doc, path)
+            if isinstance(value, list) and value:
+                for item in value:
+                    unwound = dict(doc)
+                    _set_path(unwound, path, item)
+                    result.append(unwound)
+            elif isinstance(value, list) or value in (_MISSING, None):
+                if preserve:
+                    unwound = dict(doc)
+                    _unset_path(unwound, path)
+                    result.append(unwound)
+            else:
+                result.append(doc)
+        return result
+
+    def _stage_lookup(self, docs, spec):
+        foreign = self[spec["from"]]
+        result = []
+        for doc in docs:
+            matched = None
+            if "localField" in spec:
+                local = _get_path(doc, spec["localField"])
+                local = None if local is _MISSING else local
+                condition = {"$in": local} if isinstance(local, list) else local
+                matched = [_copy(d) for _, d in foreign._matching({spec["foreignField"]: condition})]
+            if "pipeline" in spec:
+                variables = {name: evaluate(expr, doc) for name, expr in spec.get("let", {}).items()}
+                candidates = matched if matched is not None else [_copy(d) for d in foreign._docs.values()]
+                matched = self._run_pipeline(candidates, _bind_variables(spec["pipeline"], variables))
+            out = dict(doc)
+            out[spec["as"]] = matched or []
+            result.append(out)
+        return result
+
+    def _stage_facet(self, docs, spec):
+        return [{name: self._run_pipeline([_copy(doc) for doc in docs], stages) for name, stages in spec.items()}]
+
+
+def _bind_variables(value, variables: Dict[str, Any]):
+    """Substitute $$name references from a $lookup `let` into a sub-pipeline."""
+    if isinstance(value, str) and value.startswith("$$"):
+        name, _, path = value[2:].partition(".")
+        if name in variables:
+            bound = variables[name]
+            bound = _get_path(bound, path) if path else bound
+            return {"$literal": None if bound is _MISSING else bound}
+        return value
+    if isinstance(value, list):
+        return [_bind_variables(item, variables) for item in value]
+    if isinstance(value, dict):
+        return {key: _bind_variables(item, variables) for key, item in value.items()}
+    return value
@@ -0,0 +1,411 @@
+"""Lightweight Prometheus-style metrics.
+
+Hand-rolled counters, gauges and histograms rendered in the Prometheus text
+exposition format, an ASGI middleware recording per-route request metrics and a
+pymongo CommandListener recording MongoDB command counts and latencies. Updates
+are a dict lookup plus a bisect under a lock, cheap enough to leave on in production.
+
+Database commands are also attributed to the request that issued them through a
+context variable (Motor copies the context into its executor threads), which
+QueryAccountingMiddleware reports in response headers and checks against a budget.
+"""
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+from starlette.datastructures import MutableHeaders
+from starlette.routing import Match
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+REQUEST_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in values
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = REQUEST_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: [per-bucket counts (non-cumulative, last one is +Inf), sum]
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, *labels: str, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = [(labels, list(counts), total[0]) for labels, (counts, total) in self._values.items()]
+        lines = self.header()
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+# A collector returns (name, kind, documentation, labelnames, [(label values, value)])
+Collector = Callable[[], Iterable[Tuple[str, str, str, Sequence[str], Iterable[Tuple[LabelValues, float]]]]]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Collector] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = REQUEST_LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Collector):
+        """Register a callback producing samples at scrape time, for state owned elsewhere."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, documentation, labelnames, samples in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(float(value))}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by method, route template and status code",
+    ("method", "route", "status")
+)
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by method and route template",
+    ("method", "route")
+)
+http_requests_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests currently being served")
+mongo_commands = registry.counter(
+    "mongodb_commands_total", "MongoDB commands by collection, command and outcome",
+    ("collection", "command", "outcome")
+)
+mongo_command_duration = registry.histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency by collection and command",
+    ("collection", "command"), buckets=DB_LATENCY_BUCKETS
+)
+
+
+def route_template(scope) -> str:
+    """Path template of the route that served (or would serve) the request."""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # Requests answered before routing (e.g. 304s from middleware) are matched here
+    app = scope.get("app")
+    for candidate in getattr(getattr(app, "router", None), "routes", []):
+        match, _ = candidate.matches(scope)
+        if match == Match.FULL:
+            return candidate.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """Records request counts, latency and in-flight requests per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_flight.dec()
+            route = route_template(scope)
+            http_requests.inc(scope["method"], route, status)
+            http_request_duration.observe(scope["method"], route, value=elapsed)
+
+
+class RequestQueryStats:
+    """Database commands issued on behalf of one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, duration: float):
+        # Commands of one request may finish concurrently in different executor threads
+        with self._lock:
+            self.count += 1
+            self.duration += duration
+
+
+current_query_stats: contextvars.ContextVar[Optional[RequestQueryStats]] = contextvars.ContextVar(
+    "current_query_stats", default=None
+)
+
+
+def record_query(duration: float = 0.0):
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.record(duration)
+
+
+def record_memory_command(collection: str, command: str):
+    """Observer for the in-memory engine, whose operations run inline in the request."""
+    record_query()
+
+
+class QueryAccountingMiddleware:
+    """Reports the database commands each request issued in X-DB-Queries and
+    Server-Timing headers, and logs a warning when a request exceeds `budget`
+    commands (0 disables the check) so N+1 query regressions show up in the logs.
+    """
+
+    def __init__(self, app, budget: int = 0):
+        self.app = app
+        self.budget = budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestQueryStats()
+        token = current_query_stats.set(stats)
+        started = time.perf_counter()
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["X-DB-Queries"] = str(stats.count)
+                total_ms = (time.perf_counter() - started) * 1000
+                headers.append(
+                    "Server-Timing",
+                    f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries", app;dur={total_ms:.2f}'
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            current_query_stats.reset(token)
+            if self.budget and stats.count > self.budget:
+                logger.warning(
+                    f"{scope['method']} {route_template(scope)} issued {stats.count} database queries "
+                    f"(budget {self.budget})"
+                )
+
+
+def _command_collection(event) -> str:
+    target = event.command.get(event.command_name)
+    if isinstance(target, str):
+        return target
+    # getMore carries the cursor id under the command name
+    return str(event.command.get("collection", ""))
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Records MongoDB command counts and latencies; pass it to the client's event_listeners."""
+
+    def __init__(self):
+        self._pending: Dict[Tuple[int, int], Tuple[str, str]] = {}
+
+    def _key(self, event) -> Tuple[int, int]:
+        return event.request_id, event.operation_id
+
+    def started(self, event):
+        self._pending[self._key(event)] = (_command_collection(event), event.command_name)
+
+    def _finish(self, event, outcome: str):
+        collection, command = self._pending.pop(self._key(event), ("", event.command_name))
+        mongo_commands.inc(collection, command, outcome)
+        mongo_command_duration.observe(collection, command, value=event.duration_micros / 1e6)
+        record_query(event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "failure")
+
+
+mongo_command_metrics = MongoCommandMetrics()
+
+
+class ConnectionPoolStats(monitoring.ConnectionPoolListener):
+    """Tracks connection pool usage per server; pass it to the client's event_listeners."""
+
+    FIELDS = ("open", "checked_out", "waiters", "created", "closed", "check_out_failures", "cleared")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools: Dict[str, Dict[str, int]] = {}
+
+    def _update(self, address, **changes: int):
+        key = f"{address[0]}:{address[1]}" if isinstance(address, tuple) else str(address)
+        with self._lock:
+            pool = self._pools.setdefault(key, dict.fromkeys(self.FIELDS, 0))
+            for field, change in changes.items():
+                pool[field] += change
+
+    def pool_created(self, event):
+        self._update(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._update(event.address, cleared=1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._update(event.address, open=1, created=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event.address, open=-1, closed=1)
+
+    def connection_check_out_started(self, event):
+        self._update(event.address, waiters=1)
+
+    def connection_check_out_failed(self, event):
+        self._update(event.address, waiters=-1, check_out_failures=1)
+
+    def connection_checked_out(self, event):
+        self._update(event.address, waiters=-1, checked_out=1)
+
+    def connection_checked_in(self, event):
+        self._update(event.address, checked_out=-1)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {address: dict(pool) for address, pool in self._pools.items()}
+
+    def collect(self):
+        stats = self.stats()
+        for field, kind, documentation in (
+            ("open", "gauge", "Open connections in the MongoDB pool"),
+            ("checked_out", "gauge", "MongoDB connections currently checked out"),
+            ("waiters", "gauge", "Operations waiting to check out a MongoDB connection"),
+            ("check_out_failures", "counter", "Failed MongoDB connection check-outs (e.g. wait queue timeouts)"),
+            ("cleared", "counter", "Times the MongoDB pool was cleared after an error"),
+        ):
+            name = f"mongodb_pool_{field}" + ("_total" if kind == "counter" else "")
+            yield (name, kind, documentation, ("address",), [((address,), pool[field]) for address, pool in stats.items()])
+
+
+connection_pool_stats = ConnectionPoolStats()
+registry.add_collector(connection_pool_stats.collect)
@@ -0,0 +1,87 @@
+"""Password hashing that stays off the event loop.
+
+Hashing and verification are deliberately slow, so they run in a small dedicated
+thread pool (passlib's pbkdf2/bcrypt backends release the GIL). The number of
+jobs waiting for the pool is capped: past the cap callers get PasswordHasherBusy
+instead of queueing behind a login burst indefinitely.
+
+Users stored before hashing was introduced have plaintext passwords; verify()
+accepts those once and returns a hash to store in their place, and it does the
+same for hashes made with a scheme other than the configured one.
+
+Logins for unknown emails verify against a dummy hash, so the response time does
+not reveal whether an email is registered.
+"""
+import asyncio
+import hmac
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from passlib.context import CryptContext
+
+# Schemes kept verifiable when the configured one changes, so old hashes migrate on login
+KNOWN_SCHEMES = ("pbkdf2_sha256", "bcrypt", "argon2")
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many hash/verify jobs are already waiting for the pool."""
+
+
+class PasswordHasher:
+    def __init__(self, scheme: str, workers: int, max_pending: int):
+        self.context = CryptContext(
+            schemes=[scheme] + [name for name in KNOWN_SCHEMES if name != scheme],
+            deprecated="auto"
+        )
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self.workers = workers
+        self.pending = 0
+        self.rejected = 0
+        self._dummy_hash: Optional[str] = None
+
+    async def _run(self, fn: Callable[..., Any], *args) -> Any:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    def _verify(self, password: str, stored: str) -> Tuple[bool, Optional[str]]:
+        if self.context.identify(stored, required=False) is None:
+            # Legacy plaintext password
+            valid = hmac.compare_digest(password.encode(), stored.encode())
+            return valid, self.context.hash(password) if valid else None
+        return self.context.verify_and_update(password, stored)
+
+    async def verify(self, password: str, stored: str) -> Tuple[bool, Optional[str]]:
+        """Check `password` against a stored hash (or legacy plaintext).
+
+        Returns (valid, new_hash); new_hash is set when the stored value should be replaced.
+        """
+        return await self._run(self._verify, password, stored)
+
+    def _verify_unknown(self, password: str) -> Tuple[bool, Optional[str]]:
+        if self._dummy_hash is None:
+            # Made once, with the configured scheme, so it costs what a real check costs
+            self._dummy_hash = self.context.hash(secrets.token_urlsafe(32))
+        self.context.verify(password, self._dummy_hash)
+        return False, None
+
+    async def verify_unknown(self, password: str) -> Tuple[bool, Optional[str]]:
+        """Spend the work of verify() for an account that does not exist; always (False, None)."""
+        return await self._run(self._verify_unknown, password)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "pending": self.pending, "max_pending": self.max_pending,
+                "rejected": self.rejected}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
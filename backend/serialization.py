@@ -0,0 +1,73 @@
+"""Fast response path for documents read back from our own collections.
+
+Documents were validated by the endpoints that wrote them, so instead of rebuilding
+Pydantic models and letting `response_model` validate them again, they are only
+reshaped to the response model's fields (filling defaults for fields older
+documents lack) and encoded with orjson when it is installed.
+"""
+import json
+from datetime import date, datetime
+from inspect import isclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type, get_args, get_origin
+
+from pydantic import BaseModel
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # optional dependency, falls back to the standard library encoder
+    orjson = None
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_json_default)
+    return json.dumps(content, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def _list_item_model(annotation) -> Optional[Type[BaseModel]]:
+    if get_origin(annotation) in (list, List):
+        args = get_args(annotation)
+        if args and isclass(args[0]) and issubclass(args[0], BaseModel):
+            return args[0]
+    return None
+
+
+# Per model: (field name, FieldInfo, nested model for List[Model] fields)
+_model_fields: Dict[Type[BaseModel], List[Tuple[str, Any, Optional[Type[BaseModel]]]]] = {}
+
+
+def shape(model: Type[BaseModel], doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduce a stored document to the fields `model` serializes, without validation."""
+    fields = _model_fields.get(model)
+    if fields is None:
+        fields = _model_fields[model] = [
+            (name, field, _list_item_model(field.annotation)) for name, field in model.model_fields.items()
+        ]
+    shaped = {}
+    for name, field, nested in fields:
+        if name in doc:
+            value = doc[name]
+            if nested is not None and isinstance(value, list):
+                value = [shape(nested, item) if isinstance(item, dict) else item for item in value]
+            shaped[name] = value
+        elif not field.is_required():
+            shaped[name] = field.get_default(call_default_factory=True)
+    return shaped
+
+
+def shape_all(model: Type[BaseModel], docs: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [shape(model, doc) for doc in docs]
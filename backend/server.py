@@ -1,14 +1,36 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError, PyMongoError
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
 import os
+import asyncio
 import logging
+import math
 from pathlib import Path
+from cache import CollectionVersions, ConditionalGetMiddleware, ReadThroughCache, cache_stats
+from memory_db import InMemoryDatabase
+from passwords import PasswordHasher, PasswordHasherBusy
+from serialization import FastJSONResponse, dumps, shape, shape_all
+from invalidation import InvalidationBus
+from metrics import (
+    MetricsMiddleware,
+    QueryAccountingMiddleware,
+    connection_pool_stats,
+    http_requests_in_flight,
+    mongo_command_metrics,
+    record_memory_command,
+    registry as metrics_registry
+)
+from write_buffer import WriteBehindBuffer
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Generic, Tuple, TypeVar, Union
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import time
 
 
 ROOT_DIR = Path(__file__).parent
@@ -21,68 +43,283 @@ app = FastAPI(title="Real Estate Training Platform API", version="1.0.0")
 mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
 db_name = os.environ.get('DB_NAME', 'real_estate_training')
 
+# Admin statistics snapshot refresh policy
+admin_stats_refresh_seconds = float(os.environ.get('ADMIN_STATS_REFRESH_SECONDS', '300'))
+admin_stats_write_threshold = int(os.environ.get('ADMIN_STATS_WRITE_THRESHOLD', '500'))
+
+# Maximum number of heartbeats accepted by POST /api/video-progress/batch
+progress_batch_max_size = int(os.environ.get('PROGRESS_BATCH_MAX_SIZE', '500'))
+
+# Optional write-behind buffering of progress heartbeats
+progress_write_behind = os.environ.get('PROGRESS_WRITE_BEHIND', 'false').lower() in ('1', 'true', 'yes')
+progress_flush_interval_seconds = float(os.environ.get('PROGRESS_FLUSH_INTERVAL_SECONDS', '5'))
+progress_flush_max_pending = int(os.environ.get('PROGRESS_FLUSH_MAX_PENDING', '1000'))
+
+# Raw watch-event log (time-series collection) and its hourly/daily rollups
+watch_events_enabled = os.environ.get('WATCH_EVENTS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+watch_events_ttl_days = float(os.environ.get('WATCH_EVENTS_TTL_DAYS', '30'))
+watch_rollup_interval_seconds = float(os.environ.get('WATCH_ROLLUP_INTERVAL_SECONDS', '60'))
+
+# Half-life of the time-decayed view counts behind /api/admin/top-videos?ranking=trending
+trending_half_life_hours = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', '72'))
+
+# Keyset pagination for list endpoints (?limit=&after=)
+default_page_size = int(os.environ.get('DEFAULT_PAGE_SIZE', '100'))
+max_page_size = int(os.environ.get('MAX_PAGE_SIZE', '1000'))
+
+# In-process cache for rarely-changing singleton documents (settings, banner video)
+settings_cache_ttl_seconds = float(os.environ.get('SETTINGS_CACHE_TTL_SECONDS', '300'))
+
+# Serve documents read from our own collections without re-validating them (see serialization.py)
+fast_serialization = os.environ.get('FAST_SERIALIZATION', 'true').lower() in ('1', 'true', 'yes')
+
+# Warn about requests issuing more database queries than this (0 disables the check)
+db_query_budget = int(os.environ.get('DB_QUERY_BUDGET', '10'))
+
+# Password hashing: passlib scheme for new hashes, size of the hashing thread pool and
+# how many hash/verify jobs may wait for it before logins are answered with 503
+password_hash_scheme = os.environ.get('PASSWORD_HASH_SCHEME', 'pbkdf2_sha256')
+password_hash_workers = int(os.environ.get('PASSWORD_HASH_WORKERS', '4'))
+password_hash_max_pending = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '64'))
+
+# MongoDB connection pool, per worker process. Unset options keep the driver defaults.
+mongo_min_pool_size = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+mongo_max_pool_size = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+mongo_max_idle_time_ms = os.environ.get('MONGO_MAX_IDLE_TIME_MS')
+mongo_wait_queue_timeout_ms = os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS')
+mongo_connect_timeout_ms = os.environ.get('MONGO_CONNECT_TIMEOUT_MS')
+mongo_socket_timeout_ms = os.environ.get('MONGO_SOCKET_TIMEOUT_MS')
+mongo_compressors = os.environ.get('MONGO_COMPRESSORS', '')
+
+# Read preference for heavy read-only analytics (admin stats, dashboards, video stats).
+# Progress, auth and catalogue reads always use the primary. maxStalenessSeconds must be
+# at least 90; 0 disables the bound.
+analytics_read_preference_mode = os.environ.get('ANALYTICS_READ_PREFERENCE', 'secondaryPreferred')
+analytics_max_staleness_seconds = int(os.environ.get('ANALYTICS_MAX_STALENESS_SECONDS', '90'))
+
+# Seconds shutdown waits for in-flight requests to finish before closing the client
+shutdown_grace_seconds = float(os.environ.get('SHUTDOWN_GRACE_SECONDS', '10'))
+
+# Cross-worker cache invalidation: "changestream", "poll", "auto" (change streams when the
+# deployment is a replica set, polling otherwise) or "off". Defaults to "auto" when running
+# more than one worker (WEB_CONCURRENCY) and "off" otherwise; set it explicitly when several
+# containers share the database.
+web_concurrency = int(os.environ.get('WEB_CONCURRENCY', '1'))
+invalidation_mode = (os.environ.get('INVALIDATION_MODE') or ('auto' if web_concurrency > 1 else 'off')).lower()
+invalidation_poll_seconds = float(os.environ.get('INVALIDATION_POLL_SECONDS', '2'))
+
+# Storage backend: "mongo" (default, falls back to memory if unreachable) or "memory"
+storage_backend = os.environ.get('STORAGE_BACKEND', 'mongo').lower()
+
+def mongo_client_options() -> Dict[str, Any]:
+    options: Dict[str, Any] = {
+        "minPoolSize": mongo_min_pool_size,
+        "maxPoolSize": mongo_max_pool_size,
+    }
+    for option, value in (
+        ("maxIdleTimeMS", mongo_max_idle_time_ms),
+        ("waitQueueTimeoutMS", mongo_wait_queue_timeout_ms),
+        ("connectTimeoutMS", mongo_connect_timeout_ms),
+        ("socketTimeoutMS", mongo_socket_timeout_ms),
+    ):
+        if value:
+            options[option] = int(value)
+    if mongo_compressors:
+        options["compressors"] = mongo_compressors
+    return options
+
+READ_PREFERENCE_MODES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+def make_read_preference(mode: str, max_staleness_seconds: int):
+    if mode not in READ_PREFERENCE_MODES:
+        raise ValueError(f"Unknown read preference {mode!r}; expected one of {', '.join(READ_PREFERENCE_MODES)}")
+    if mode == "primary":
+        return Primary()
+    return READ_PREFERENCE_MODES[mode](max_staleness=max_staleness_seconds if max_staleness_seconds > 0 else -1)
+
+analytics_read_preference = make_read_preference(analytics_read_preference_mode, analytics_max_staleness_seconds)
+
+# Collection handle for analytics reads, which may be served by a secondary up to
+# maxStalenessSeconds behind. Never use it for reads that must see the caller's own writes.
+def analytics_collection(name: str):
+    return db.get_collection(name, read_preference=analytics_read_preference)
+
+# Open the minimum pool up front so the first requests after a deploy do not pay
+# for connection setup: concurrent pings each need their own connection
+async def warm_up_pool(client):
+    if mongo_min_pool_size <= 0:
+        return
+    started = time.perf_counter()
+    await asyncio.gather(*(client.admin.command('ping') for _ in range(mongo_min_pool_size)))
+    logger.info(f"Warmed up {mongo_min_pool_size} MongoDB connections in {(time.perf_counter() - started) * 1000:.1f} ms")
+
 async def init_db():
+    if storage_backend == 'memory':
+        print("🧠 Using in-memory storage (STORAGE_BACKEND=memory)")
+        return None, InMemoryDatabase(db_name, observers=[record_memory_command])
     try:
-        client = AsyncIOMotorClient(mongo_url, serverSelectionTimeoutMS=5000)
+        client = AsyncIOMotorClient(
+            mongo_url,
+            serverSelectionTimeoutMS=5000,
+            event_listeners=[mongo_command_metrics, connection_pool_stats],
+            **mongo_client_options()
+        )
         # Test connection
         await client.admin.command('ping')
+        await warm_up_pool(client)
         db = client[db_name]
         print("✅ MongoDB connected successfully")
         return client, db
     except Exception as e:
         print(f"❌ MongoDB connection failed: {e}")
         # Use in-memory storage as fallback
-        from motor.core import AgnosticDatabase
-        class InMemoryDB:
-            def __init__(self):
-                self.data = {
-                    'categories': [],
-                    'users': [],
-                    'videos': [],
-                    'settings': [],
-                    'banner_videos': []
-                }
-            
-            def __getattr__(self, name):
-                return InMemoryCollection(self.data.get(name, []))
-        
-        class InMemoryCollection:
-            def __init__(self, data):
-                self.data = data
-            
-            async def find(self):
-                return MockCursor(self.data)
-            
-            async def find_one(self, query=None):
-                return self.data[0] if self.data else None
-            
-            async def insert_one(self, doc):
-                self.data.append(doc)
-                return type('Result', (), {'inserted_id': 'temp'})()
-            
-            async def update_one(self, query, update):
-                return type('Result', (), {'matched_count': 1})()
-            
-            async def delete_one(self, query):
-                return type('Result', (), {'deleted_count': 1})()
-            
-            async def delete_many(self, query):
-                return type('Result', (), {'deleted_count': len(self.data)})()
-        
-        class MockCursor:
-            def __init__(self, data):
-                self.data = data
-            
-            async def to_list(self, length):
-                return self.data
-        
-        return None, InMemoryDB()
+        print("🧠 Falling back to in-memory storage")
+        return None, InMemoryDatabase(db_name, observers=[record_memory_command])
+
+# Indexes backing the hot queries. The (user_email, video_id) compound index also
+# serves lookups by user_email alone and keeps progress upserts free of duplicates.
+INDEX_SPECS: Dict[str, List[IndexModel]] = {
+    "video_progress": [
+        IndexModel([("user_email", ASCENDING), ("video_id", ASCENDING)], name="user_email_video_id", unique=True),
+        IndexModel([("video_id", ASCENDING)], name="video_id"),
+        IndexModel([("id", ASCENDING)], name="id", unique=True),
+        # Time-range analytics (?from=&to=) on admin stats and dashboards
+        IndexModel([("last_watched", ASCENDING)], name="last_watched"),
+        IndexModel([("created_at", ASCENDING)], name="created_at"),
+        IndexModel([("user_email", ASCENDING), ("last_watched", ASCENDING)], name="user_email_last_watched"),
+    ],
+    "videos": [
+        IndexModel([("id", ASCENDING)], name="id", unique=True),
+        IndexModel([("categoryId", ASCENDING), ("id", ASCENDING)], name="categoryId_id"),
+    ],
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email", unique=True),
+        IndexModel([("id", ASCENDING)], name="id", unique=True),
+        IndexModel([("created_at", ASCENDING)], name="created_at"),
+    ],
+    "categories": [
+        IndexModel([("id", ASCENDING)], name="id", unique=True),
+    ],
+    "video_stats": [
+        IndexModel([("video_id", ASCENDING)], name="video_id", unique=True),
+        # Top-N most watched videos: an index walk of the first N entries
+        IndexModel([("total_views", DESCENDING), ("video_id", ASCENDING)], name="total_views_desc_video_id"),
+    ],
+    "status_checks": [
+        IndexModel([("id", ASCENDING)], name="id", unique=True),
+    ],
+    "watch_rollups": [
+        IndexModel([("granularity", ASCENDING), ("scope", ASCENDING), ("key", ASCENDING), ("bucket", ASCENDING)],
+                   name="granularity_scope_key_bucket", unique=True),
+        IndexModel([("granularity", ASCENDING), ("scope", ASCENDING), ("bucket", ASCENDING)],
+                   name="granularity_scope_bucket"),
+    ],
+}
+
+# Duplicates written before a unique index existed (e.g. racing progress heartbeats)
+# would make its build fail, so they are merged into one document first. Documents
+# are passed oldest first; the merge returns the one to keep.
+def _merge_duplicate_progress(docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    kept = dict(docs[0])  # earliest id and created_at
+    for field in ("progress_percentage", "watch_time", "completed", "last_watched"):
+        values = [doc[field] for doc in docs if doc.get(field) is not None]
+        if values:
+            kept[field] = max(values)
+    return kept
+
+def _merge_duplicate_users(docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return docs[0]  # the account registered first keeps its id and password
+
+UNIQUE_INDEX_DEDUPLICATION = {
+    ("video_progress", "user_email_video_id"): _merge_duplicate_progress,
+    ("users", "email"): _merge_duplicate_users,
+}
+
+async def merge_duplicates(collection_name: str, fields: List[str], merge) -> int:
+    collection = db[collection_name]
+    groups = await collection.aggregate([
+        {"$group": {"_id": {field: f"${field}" for field in fields}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True).to_list(None)
+    removed = 0
+    for group in groups:
+        docs = await collection.find({"_id": {"$in": group["ids"]}}).to_list(None)
+        docs.sort(key=lambda doc: (doc.get("created_at") is None, doc.get("created_at") or datetime.min))
+        kept = merge(docs)
+        await collection.replace_one({"_id": kept["_id"]}, kept)
+        result = await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs if doc["_id"] != kept["_id"]]}})
+        removed += result.deleted_count
+    if removed:
+        logger.warning(f"Merged {removed} duplicate {collection_name} documents on {', '.join(fields)}")
+    return removed
+
+# Create every declared index that does not exist yet. Safe to run on each startup.
+async def ensure_indexes() -> List[Dict[str, Any]]:
+    report = []
+    for collection_name, indexes in INDEX_SPECS.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        for index in indexes:
+            name = index.document["name"]
+            if name in existing:
+                continue
+            started = time.perf_counter()
+            merged = 0
+            try:
+                merge = UNIQUE_INDEX_DEDUPLICATION.get((collection_name, name))
+                if merge is not None:
+                    merged = await merge_duplicates(collection_name, list(index.document["key"]), merge)
+                await collection.create_indexes([index])
+                status = "built"
+            except PyMongoError as e:
+                status = "failed"
+                logger.error(f"Index {collection_name}.{name} could not be built: {e}")
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            report.append({
+                "collection": collection_name,
+                "index": name,
+                "status": status,
+                "duplicates_merged": merged,
+                "elapsed_ms": round(elapsed_ms, 2)
+            })
+            if status == "built":
+                logger.info(f"Index {collection_name}.{name} built in {elapsed_ms:.1f} ms")
+    if not report:
+        logger.info("All declared indexes already exist")
+    return report
 
 client, db = None, None  # Initialize with None
+background_tasks: List[asyncio.Task] = []  # Long-running tasks cancelled at shutdown
+
+def _log_task_failure(task: asyncio.Task):
+    # Nothing awaits these tasks before shutdown, so a crash would otherwise go unnoticed
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Background task {task.get_name()} stopped", exc_info=task.exception())
+
+def start_background_task(coro, name: str) -> asyncio.Task:
+    task = asyncio.create_task(coro, name=name)
+    task.add_done_callback(_log_task_failure)
+    background_tasks.append(task)
+    return task
+
 @app.on_event("startup")
 async def startup_db_client():
     global client, db
     client, db = await init_db()
+    report = await ensure_indexes()
+    # Backfill materialized video statistics for databases that predate video_stats,
+    # and recount them when duplicate progress records were merged away
+    if any(entry["collection"] == "video_progress" and entry["duplicates_merged"] for entry in report):
+        await rebuild_video_stats()
+    elif await db.video_stats.count_documents({}, limit=1) == 0:
+        if await db.video_progress.count_documents({}, limit=1):
+            await rebuild_video_stats()
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -97,6 +334,16 @@ class User(BaseModel):
     role: str  # 'admin' or 'user'
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+# User as returned by the API: never includes the password hash
+class UserPublic(BaseModel):
+    id: str
+    email: str
+    name: str
+    role: str
+    created_at: datetime
+
+USER_PUBLIC_FIELDS = list(UserPublic.model_fields)
+
 class UserCreate(BaseModel):
     email: str
     password: str
@@ -244,7 +491,219 @@ class UserDashboard(BaseModel):
     completion_rate: float = 0.0
     recent_videos: List[VideoWithStats] = []
     progress_by_category: Dict[str, Dict[str, Any]] = {}
+    range: Optional[Dict[str, Any]] = None  # set for ?from=&to=
+
+
+# Keyset pagination
+T = TypeVar("T")
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None  # pass as ?after= to get the next page; None on the last page
+
+# Pagination is opt-in: without ?limit= or ?after= list endpoints keep returning plain lists
+def _is_paginated(limit: Optional[int], after: Optional[str]) -> bool:
+    return limit is not None or after is not None
+
+# Fetch one page ordered by an indexed, unique `sort_key`, resuming after the cursor value.
+# `stages` (e.g. a $lookup) are applied to the page in the same aggregation.
+async def fetch_page(
+    collection,
+    query: Dict[str, Any],
+    sort_key: str,
+    limit: Optional[int],
+    after: Optional[str],
+    projection: Optional[Dict[str, int]] = None,
+    stages: Optional[List[Dict[str, Any]]] = None
+):
+    limit = limit or default_page_size
+    if after is not None:
+        query = {**query, sort_key: {"$gt": after}}
+    if stages:
+        docs = await collection.aggregate([
+            {"$match": query},
+            {"$sort": {sort_key: 1}},
+            {"$limit": limit + 1},
+            {"$project": projection or {"_id": 0}},
+            *stages
+        ]).to_list(limit + 1)
+    else:
+        docs = await collection.find(query, projection or {"_id": 0}).sort(sort_key, ASCENDING).limit(limit + 1).to_list(limit + 1)
+    next_cursor = docs[limit - 1][sort_key] if len(docs) > limit else None
+    return docs[:limit], next_cursor
+
+PageLimit = Query(None, ge=1, le=max_page_size)
+
+# Time-range filters for analytics (?from=&to=, ISO 8601; `to` is exclusive)
+RangeFrom = Query(None, alias="from", description="Start of the range (inclusive)")
+RangeTo = Query(None, description="End of the range (exclusive)")
+
+def _as_utc(value: datetime) -> datetime:
+    # Stored timestamps are naive UTC
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+def date_range(from_: Optional[datetime], to: Optional[datetime]) -> Optional[Dict[str, datetime]]:
+    """Range condition for a datetime field, or None when neither bound is given."""
+    from_ = _as_utc(from_) if from_ is not None else None
+    to = _as_utc(to) if to is not None else None
+    if from_ is not None and to is not None and from_ >= to:
+        raise HTTPException(status_code=422, detail="'from' debe ser anterior a 'to'")
+    condition = {}
+    if from_ is not None:
+        condition["$gte"] = from_
+    if to is not None:
+        condition["$lt"] = to
+    return condition or None
+
+# Streaming exports (?format=ndjson)
+ListFormat = Query("json", pattern="^(json|ndjson)$")
+NDJSON_CHUNK_SIZE = 100  # documents per streamed chunk
+
+# Stream every matching document as newline-delimited JSON while the cursor is
+# iterated, so memory stays flat and the first bytes go out immediately
+def ndjson_response(
+    collection,
+    query: Dict[str, Any],
+    sort_key: str,
+    model,
+    limit: Optional[int],
+    after: Optional[str],
+    fields: Optional[List[str]] = None
+) -> StreamingResponse:
+    if after is not None:
+        query = {**query, sort_key: {"$gt": after}}
+    cursor = collection.find(query, field_projection(fields)).sort(sort_key, ASCENDING)
+    if limit is not None:
+        cursor = cursor.limit(limit)
+    
+    async def lines():
+        chunk = []
+        async for doc in cursor:
+            if fields is not None:
+                chunk.append(dumps(pick_fields(doc, fields)).decode())
+            else:
+                chunk.append(dumps(shape(model, doc)).decode() if fast_serialization else model(**doc).model_dump_json())
+            if len(chunk) >= NDJSON_CHUNK_SIZE:
+                yield "\n".join(chunk) + "\n"
+                chunk = []
+        if chunk:
+            yield "\n".join(chunk) + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+# Field projections (?fields=a,b or ?view=summary). The selection is passed to MongoDB
+# so unused fields, like the long video descriptions, never leave the database.
+VIDEO_SUMMARY_FIELDS = ["id", "title", "thumbnail", "duration", "categoryId", "difficulty", "rating", "match"]
+FieldsParam = Query(None, description="Comma-separated fields to return, e.g. id,title,thumbnail")
+ViewParam = Query("full", pattern="^(full|summary)$")
+
+# Fields requested for `model`, or None for the full document. `id` is always included.
+def requested_fields(model, fields: Optional[str], view: str, summary_fields: List[str]) -> Optional[List[str]]:
+    if fields:
+        requested = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in requested if field not in model.model_fields]
+        if unknown:
+            raise HTTPException(status_code=422, detail=f"Campos desconocidos: {', '.join(unknown)}")
+        return ["id"] + [field for field in requested if field != "id"]
+    if view == "summary":
+        return list(summary_fields)
+    return None
+
+def field_projection(fields: Optional[List[str]], *extra: str) -> Dict[str, int]:
+    if fields is None:
+        return {"_id": 0}
+    return {"_id": 0, **{field: 1 for field in [*fields, *extra]}}
+
+def pick_fields(doc: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    return {field: doc[field] for field in fields if field in doc}
+
+# Respond with documents read from our own collections. With FAST_SERIALIZATION they
+# are reshaped to `model` and encoded directly, skipping response_model validation;
+# otherwise they are returned for FastAPI to validate as usual. Projected documents
+# (`fields`) are partial by design and are always encoded directly.
+def trusted_response(
+    model,
+    docs: List[Dict[str, Any]],
+    paginated: bool = False,
+    next_cursor: Optional[str] = None,
+    fields: Optional[List[str]] = None
+):
+    if fields is not None:
+        items = [pick_fields(doc, fields) for doc in docs]
+    elif fast_serialization:
+        items = shape_all(model, docs)
+    else:
+        return Page[model](items=docs, next_cursor=next_cursor) if paginated else docs
+    return FastJSONResponse({"items": items, "next_cursor": next_cursor} if paginated else items)
+
+# Caching
+# Settings and banner video are read on every page load but change rarely, so they
+# are served from read-through caches. Every mutating endpoint reports the logical
+# collections it changed through collection_changed(), which bumps their version
+# counters (used for ETags) and invalidates the caches built from them. With several
+# workers the invalidation bus (see invalidation.py) applies the same changes in the
+# other processes.
+settings_cache = ReadThroughCache("settings", ttl=settings_cache_ttl_seconds)
+banner_video_cache = ReadThroughCache("banner_video", ttl=settings_cache_ttl_seconds)
+collection_versions = CollectionVersions()
+
+CACHES_BY_COLLECTION: Dict[str, List[ReadThroughCache]] = {
+    "settings": [settings_cache],
+    "banner_videos": [banner_video_cache],
+}
+
+# Routes answered with ETags / 304s, and the collections their responses depend on
+VERSIONED_ROUTES = {
+    "/api/categories": ("categories", "videos"),
+    "/api/categories/{category_id}/videos": ("videos",),
+    "/api/videos": ("videos",),
+    "/api/settings": ("settings",),
+    "/api/banner-video": ("banner_videos",),
+}
+
+# Collections whose changes are broadcast to the other workers
+INVALIDATION_COLLECTIONS = ("videos", "categories", "settings", "banner_videos")
+invalidation_bus: Optional[InvalidationBus] = None
+invalidation_task: Optional[asyncio.Task] = None
+
+def apply_collection_changes(names):
+    collection_versions.bump(*names)
+    for name in names:
+        for cache in CACHES_BY_COLLECTION.get(name, []):
+            cache.invalidate()
+
+async def collection_changed(*names: str):
+    apply_collection_changes(names)
+    if invalidation_bus is not None:
+        try:
+            await invalidation_bus.publish(names)
+        except PyMongoError as e:
+            # Other workers catch up when their cache TTLs expire
+            logger.warning(f"Could not publish cache invalidation for {', '.join(names)}: {e}")
+
+@app.on_event("startup")
+async def start_invalidation_bus():
+    global invalidation_bus, invalidation_task
+    if invalidation_mode == "off":
+        return
+    if client is None:
+        # The memory backend lives inside one process; there is nothing to share
+        logger.warning("INVALIDATION_MODE is ignored with the memory backend; run a single worker")
+        return
+    invalidation_bus = InvalidationBus(
+        db,
+        INVALIDATION_COLLECTIONS,
+        apply_collection_changes,
+        mode=invalidation_mode,
+        poll_interval=invalidation_poll_seconds
+    )
+    invalidation_task = start_background_task(invalidation_bus.run(), "invalidation-bus")
 
+@api_router.get("/admin/invalidation")
+async def get_invalidation_stats():
+    if invalidation_bus is None:
+        return {"enabled": False}
+    return {"enabled": True, "running": not invalidation_task.done(), **invalidation_bus.stats()}
 
 # Helper function to initialize default categories
 async def initialize_default_categories():
@@ -260,10 +719,24 @@ async def initialize_default_categories():
         {"id": "9", "name": "Atención al Cliente", "icon": "Users", "videos": []}
     ]
     
-    for category_data in default_categories:
-        category_obj = Category(**category_data, created_at=datetime.utcnow())
-        await db.categories.insert_one(category_obj.dict())
+    try:
+        await db.categories.insert_many(
+            [Category(**category_data, created_at=datetime.utcnow()).dict() for category_data in default_categories],
+            ordered=False
+        )
+    except BulkWriteError:
+        pass  # A concurrent request initialized them first; the unique index rejected the duplicates
+    await collection_changed("categories")
+
 
+# Password hashing runs in a bounded thread pool so slow hashes never block the event loop
+password_hasher = PasswordHasher(password_hash_scheme, password_hash_workers, password_hash_max_pending)
+
+async def _password_call(call):
+    try:
+        return await call
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Servidor ocupado, intenta de nuevo en unos segundos")
 
 # Authentication endpoints
 @api_router.post("/auth/login")
@@ -276,54 +749,267 @@ async def login_user(user_login: UserLogin):
             return {"role": "user", "email": user_login.email, "name": "Usuario"}
     
     # Check custom users in database
-    user = await db.users.find_one({"email": user_login.email, "password": user_login.password})
+    user = await db.users.find_one({"email": user_login.email})
     if user:
-        return {"role": user["role"], "email": user["email"], "name": user["name"]}
+        valid, new_hash = await _password_call(password_hasher.verify(user_login.password, user["password"]))
+        if valid:
+            if new_hash:
+                # Migrate plaintext or outdated hashes; skipped if the password changed meanwhile
+                await db.users.update_one(
+                    {"id": user["id"], "password": user["password"]},
+                    {"$set": {"password": new_hash}}
+                )
+            return {"role": user["role"], "email": user["email"], "name": user["name"]}
+    else:
+        # Same work as a wrong password, so timing does not reveal registered emails
+        await _password_call(password_hasher.verify_unknown(user_login.password))
     
     raise HTTPException(status_code=401, detail="Credenciales inválidas")
 
 # Video Progress Tracking Endpoints
+# Build the update that merges a progress heartbeat into its (user_email, video_id)
+# record. Progress fields only move forward: $max keeps a late or out-of-order
+# heartbeat from rolling them back.
+# `record` carries id/created_at/last_watched already handed out for a buffered write.
+def _progress_merge_update(progress_data: VideoProgressCreate, now: datetime, record: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    record = record or {}
+    return {
+        "$setOnInsert": {"id": record.get("id") or str(uuid.uuid4()), "created_at": record.get("created_at", now)},
+        "$max": {
+            "progress_percentage": progress_data.progress_percentage,
+            "watch_time": progress_data.watch_time,
+            "completed": progress_data.completed
+        },
+        "$set": {"last_watched": record.get("last_watched", now)}
+    }
+
+# Apply a merge update to the record as it was before the write (None if the
+# write inserted it), mirroring what MongoDB stored.
+def _merged_progress(key: Dict[str, Any], previous: Optional[Dict[str, Any]], update: Dict[str, Any]) -> Dict[str, Any]:
+    merged = dict(previous) if previous else {**key, **update["$setOnInsert"]}
+    for field, value in update["$max"].items():
+        current = merged.get(field)
+        merged[field] = value if current is None else max(current, value)
+    merged.update(update["$set"])
+    return merged
+
+# Upsert in a single round-trip; returns the record before the write (None if it was
+# inserted) and after it. The previous state drives the video_stats delta.
+async def merge_progress_record(key: Dict[str, Any], update: Dict[str, Any]) -> tuple:
+    try:
+        previous = await db.video_progress.find_one_and_update(
+            key, update, upsert=True, return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError:
+        # A concurrent heartbeat inserted the record first, so this one is an update
+        previous = await db.video_progress.find_one_and_update(
+            key, update, upsert=True, return_document=ReturnDocument.BEFORE
+        )
+    return previous, _merged_progress(key, previous, update)
+
 @api_router.post("/video-progress", response_model=VideoProgress)
 async def create_or_update_video_progress(progress_data: VideoProgressCreate):
-    # Check if progress already exists for this user and video
-    existing_progress = await db.video_progress.find_one({
-        "user_email": progress_data.user_email,
-        "video_id": progress_data.video_id
-    })
-    
-    if existing_progress:
-        # Update existing progress
-        update_data = progress_data.dict()
-        update_data["last_watched"] = datetime.utcnow()
-        
-        await db.video_progress.update_one(
-            {"user_email": progress_data.user_email, "video_id": progress_data.video_id},
-            {"$set": update_data}
+    key = {"user_email": progress_data.user_email, "video_id": progress_data.video_id}
+    update = _progress_merge_update(progress_data, datetime.utcnow())
+    
+    if progress_buffer is not None:
+        return VideoProgress(**await buffer_video_progress(key, update))
+    
+    previous_progress, progress = await merge_progress_record(key, update)
+    # Independent writes: the stats delta and the watch event go out together
+    await asyncio.gather(
+        apply_video_stats_delta(progress_data.video_id, previous_progress, progress),
+        record_watch_events([(progress_data.video_id, previous_progress, progress)])
+    )
+    note_stats_write()
+    return VideoProgress(**progress)
+
+# Filter that only matches a progress record still in the state `previous` read for
+# it. A record changed meanwhile makes the upsert try to insert a second document,
+# which fails with E11000 on _id, or on the unique (user_email, video_id) index when
+# the record did not exist yet.
+def _guarded_progress_filter(key: tuple, previous: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    query: Dict[str, Any] = {"user_email": key[0], "video_id": key[1]}
+    if previous is None:
+        query["_id"] = {"$exists": False}
+        return query
+    query["_id"] = previous["_id"]
+    for field in ("progress_percentage", "watch_time", "completed"):
+        query[field] = previous.get(field)
+    return query
+
+# Merge many heartbeats with one unordered bulk write, using the same $max/$setOnInsert
+# semantics as the single-item endpoint. Heartbeats for the same (user_email, video_id)
+# are coalesced first. Returns one status entry per input item.
+async def apply_progress_batch(
+    items: List[VideoProgressCreate],
+    known_records: Optional[Dict[tuple, Dict[str, Any]]] = None
+) -> List[Dict[str, Any]]:
+    now = datetime.utcnow()
+    known_records = known_records or {}
+    merged: Dict[tuple, VideoProgressCreate] = {}
+    for item in items:
+        key = (item.user_email, item.video_id)
+        current = merged.get(key)
+        merged[key] = item if current is None else VideoProgressCreate(
+            user_email=item.user_email,
+            video_id=item.video_id,
+            progress_percentage=max(current.progress_percentage, item.progress_percentage),
+            watch_time=max(current.watch_time, item.watch_time),
+            completed=current.completed or item.completed
         )
-        
-        # Return updated progress
-        updated_progress = await db.video_progress.find_one({
-            "user_email": progress_data.user_email,
-            "video_id": progress_data.video_id
-        })
-        return VideoProgress(**updated_progress)
-    else:
-        # Create new progress record
-        progress_obj = VideoProgress(**progress_data.dict())
-        await db.video_progress.insert_one(progress_obj.dict())
-        return progress_obj
+    keys = list(merged)
+    if not keys:
+        return []
+    
+    # Previous state of every record, fetched in one query, for the video_stats deltas.
+    # Each write only applies if the record is still in that state (see _guarded_progress_filter).
+    previous = {
+        (doc["user_email"], doc["video_id"]): doc
+        async for doc in db.video_progress.find(
+            {"$or": [{"user_email": user_email, "video_id": video_id} for user_email, video_id in keys]}
+        )
+    }
+    updates = [_progress_merge_update(merged[key], now, known_records.get(key)) for key in keys]
+    operations = [
+        UpdateOne(_guarded_progress_filter(key, previous.get(key)), update, upsert=True)
+        for key, update in zip(keys, updates)
+    ]
+    
+    try:
+        result = await db.video_progress.bulk_write(operations, ordered=False)
+        upserted = set(result.upserted_ids)
+        failed = {}
+    except BulkWriteError as e:
+        upserted = {entry["index"] for entry in e.details.get("upserted", [])}
+        failed = {error["index"]: error for error in e.details.get("writeErrors", [])}
+    
+    key_status = {}
+    stats_changes = []
+    for index, (key, update) in enumerate(zip(keys, updates)):
+        key_dict = {"user_email": key[0], "video_id": key[1]}
+        if index in failed and failed[index].get("code") == 11000:
+            # Written by someone else since it was read: merge it again atomically
+            try:
+                before, after = await merge_progress_record(key_dict, update)
+            except PyMongoError as e:
+                key_status[key] = {"status": "error", "error": str(e)}
+                continue
+            key_status[key] = {"status": "created" if before is None else "updated"}
+            stats_changes.append((key[1], before, after))
+            continue
+        if index in failed:
+            key_status[key] = {"status": "error", "error": failed[index].get("errmsg", "")}
+            continue
+        before = previous.get(key)
+        key_status[key] = {"status": "created" if index in upserted else "updated"}
+        stats_changes.append((key[1], before, _merged_progress(key_dict, before, update)))
+    
+    await asyncio.gather(apply_video_stats_deltas(stats_changes), record_watch_events(stats_changes))
+    note_stats_write(len(stats_changes))
+    
+    results = []
+    reported = set()
+    for index, item in enumerate(items):
+        key = (item.user_email, item.video_id)
+        status = key_status[key] if key not in reported else {"status": "merged"}
+        reported.add(key)
+        results.append({"index": index, "user_email": item.user_email, "video_id": item.video_id, **status})
+    return results
+
+# Write-behind path: heartbeats are merged into the in-process buffer and written
+# to MongoDB in bulk by the flush task. Only the first heartbeat for a record since
+# the last flush reads the database.
+progress_buffer: Optional[WriteBehindBuffer] = None
+
+def _merge_buffered_progress(current: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    merged = dict(current)
+    for field in ("progress_percentage", "watch_time", "completed", "last_watched"):
+        merged[field] = max(current[field], new[field])
+    return merged
 
-@api_router.get("/video-progress/{user_email}")
-async def get_user_video_progress(user_email: str):
-    progress_list = await db.video_progress.find({"user_email": user_email}).to_list(1000)
-    return [VideoProgress(**progress) for progress in progress_list]
+async def buffer_video_progress(key: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    buffer_key = (key["user_email"], key["video_id"])
+    previous = progress_buffer.get(buffer_key)
+    if previous is None:
+        previous = await db.video_progress.find_one(key, {"_id": 0})
+    return progress_buffer.put(buffer_key, _merged_progress(key, previous, update))
+
+async def flush_buffered_progress(records: List[tuple]):
+    items = [
+        VideoProgressCreate(
+            user_email=record["user_email"],
+            video_id=record["video_id"],
+            progress_percentage=record["progress_percentage"],
+            watch_time=record["watch_time"],
+            completed=record["completed"]
+        )
+        for _, record in records
+    ]
+    results = await apply_progress_batch(items, known_records=dict(records))
+    failed = [result for result in results if result["status"] == "error"]
+    if failed:
+        logger.warning(f"{len(failed)} buffered progress records could not be written: {failed[0]['error']}")
+
+@app.on_event("startup")
+async def start_progress_buffer():
+    global progress_buffer
+    if progress_write_behind:
+        if web_concurrency > 1:
+            # Each worker buffers its own heartbeats: reads served by another worker miss
+            # them and a PUT cannot flush them before its write
+            logger.warning("PROGRESS_WRITE_BEHIND with WEB_CONCURRENCY > 1: buffered progress is per worker, "
+                           "so reads and PUT corrections on other workers do not see it")
+        progress_buffer = WriteBehindBuffer(
+            flush_buffered_progress,
+            _merge_buffered_progress,
+            flush_interval=progress_flush_interval_seconds,
+            max_pending=progress_flush_max_pending
+        )
+        start_background_task(progress_buffer.run(), "progress-buffer")
+
+@api_router.get("/admin/write-buffer")
+async def get_write_buffer_stats():
+    if progress_buffer is None:
+        return {"enabled": False}
+    return {"enabled": True, **progress_buffer.stats()}
+
+@api_router.post("/video-progress/batch")
+async def create_or_update_video_progress_batch(progress_items: List[VideoProgressCreate]):
+    if len(progress_items) > progress_batch_max_size:
+        raise HTTPException(
+            status_code=413,
+            detail=f"El lote excede el máximo de {progress_batch_max_size} registros"
+        )
+    
+    return {"results": await apply_progress_batch(progress_items)}
+
+# Full progress listing across users, meant for admin exports and integrations
+@api_router.get("/video-progress", response_model=Page[VideoProgress])
+async def get_all_video_progress(limit: Optional[int] = PageLimit, after: Optional[str] = None, format: str = ListFormat):
+    if format == "ndjson":
+        return ndjson_response(db.video_progress, {}, "id", VideoProgress, limit, after)
+    items, next_cursor = await fetch_page(db.video_progress, {}, "id", limit, after)
+    return trusted_response(VideoProgress, items, paginated=True, next_cursor=next_cursor)
+
+@api_router.get("/video-progress/{user_email}", response_model=Union[List[VideoProgress], Page[VideoProgress]])
+async def get_user_video_progress(user_email: str, limit: Optional[int] = PageLimit, after: Optional[str] = None, format: str = ListFormat):
+    if format == "ndjson":
+        return ndjson_response(db.video_progress, {"user_email": user_email}, "video_id", VideoProgress, limit, after)
+    if _is_paginated(limit, after):
+        items, next_cursor = await fetch_page(db.video_progress, {"user_email": user_email}, "video_id", limit, after)
+        return trusted_response(VideoProgress, items, paginated=True, next_cursor=next_cursor)
+    progress_list = await db.video_progress.find({"user_email": user_email}, {"_id": 0}).to_list(1000)
+    return trusted_response(VideoProgress, progress_list)
 
 @api_router.get("/video-progress/{user_email}/{video_id}")
 async def get_video_progress(user_email: str, video_id: str):
-    progress = await db.video_progress.find_one({
-        "user_email": user_email,
-        "video_id": video_id
-    })
+    progress = progress_buffer.get((user_email, video_id)) if progress_buffer is not None else None
+    if progress is None:
+        progress = await db.video_progress.find_one({
+            "user_email": user_email,
+            "video_id": video_id
+        })
     if not progress:
         return {"progress_percentage": 0.0, "watch_time": 0, "completed": False}
     return VideoProgress(**progress)
@@ -333,52 +1019,139 @@ async def update_video_progress(user_email: str, video_id: str, progress_update:
     update_data = {k: v for k, v in progress_update.dict().items() if v is not None}
     update_data["last_watched"] = datetime.utcnow()
     
-    result = await db.video_progress.update_one(
+    # Buffered heartbeats must land first, otherwise their $max merge would undo this update.
+    # Only this worker's buffer is flushed: with several workers another worker's later
+    # flush can still undo a lowered value (see the startup warning).
+    if progress_buffer is not None:
+        await progress_buffer.flush()
+    
+    previous_progress = await db.video_progress.find_one_and_update(
         {"user_email": user_email, "video_id": video_id},
-        {"$set": update_data}
+        {"$set": update_data},
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result.matched_count == 0:
+    if previous_progress is None:
         raise HTTPException(status_code=404, detail="Progreso no encontrado")
     
+    progress = {**previous_progress, **update_data}
+    await asyncio.gather(
+        apply_video_stats_delta(video_id, previous_progress, progress),
+        record_watch_events([(video_id, previous_progress, progress)])
+    )
+    note_stats_write()
     return {"message": "Progreso actualizado exitosamente"}
 
+# Aggregation pipelines backing the user dashboard. Both run server-side so the
+# number of round-trips stays fixed no matter how large the catalogue grows.
+def _dashboard_progress_pipeline(user_email: str, last_watched: Optional[Dict[str, datetime]] = None) -> List[Dict[str, Any]]:
+    completed_flag = {"$cond": ["$completed", 1, 0]}
+    match: Dict[str, Any] = {"user_email": user_email}
+    if last_watched:
+        match["last_watched"] = last_watched
+    return [
+        {"$match": match},
+        {"$facet": {
+            "totals": [
+                {"$group": {
+                    "_id": None,
+                    "watched": {"$sum": 1},
+                    "completed": {"$sum": completed_flag},
+                    "watch_time": {"$sum": "$watch_time"}
+                }}
+            ],
+            "recent": [
+                {"$sort": {"last_watched": -1}},
+                {"$limit": 5},
+                {"$lookup": {"from": "videos", "localField": "video_id", "foreignField": "id", "as": "video"}},
+                {"$unwind": "$video"},
+                {"$lookup": {"from": "video_stats", "localField": "video_id", "foreignField": "video_id", "as": "stats"}},
+                {"$project": {"_id": 0, "video": 1, "stats": 1}}
+            ],
+            "by_category": [
+                {"$lookup": {"from": "videos", "localField": "video_id", "foreignField": "id", "as": "video"}},
+                {"$unwind": "$video"},
+                {"$group": {
+                    "_id": "$video.categoryId",
+                    "watched": {"$sum": 1},
+                    "completed": {"$sum": completed_flag}
+                }}
+            ]
+        }}
+    ]
+
+# Videos per category id, counted from the videos collection alone
+def _category_video_counts_pipeline() -> List[Dict[str, Any]]:
+    return [{"$group": {"_id": "$categoryId", "total_videos": {"$sum": 1}}}]
+
+# With ?from=&to= the watched/completed/watch-time totals are what happened inside
+# the range, from the user's watch rollups: videos started, completions reached and
+# seconds watched. Recent videos and the per-category counts cover the progress
+# records last watched in the range.
 @api_router.get("/dashboard/{user_email}")
-async def get_user_dashboard(user_email: str):
-    # Get all progress for user
-    progress_list = await db.video_progress.find({"user_email": user_email}).to_list(1000)
-    
-    # Calculate statistics
-    total_videos_watched = len(progress_list)
-    total_videos_completed = sum(1 for p in progress_list if p.get("completed", False))
-    total_watch_time = sum(p.get("watch_time", 0) for p in progress_list)
-    completion_rate = (total_videos_completed / total_videos_watched * 100) if total_videos_watched > 0 else 0
+async def get_user_dashboard(user_email: str, from_: Optional[datetime] = RangeFrom, to: Optional[datetime] = RangeTo):
+    last_watched = date_range(from_, to)
+    if last_watched:
+        require_watch_rollups()
     
-    # Get recent videos (last 5 watched)
-    recent_progress = sorted(progress_list, key=lambda x: x.get("last_watched", datetime.min), reverse=True)[:5]
-    recent_videos = []
+    # The queries are independent, so they run concurrently: progress totals, recent
+    # videos and per-category counts in one facet aggregate, the catalogue lookups and,
+    # for a range, the user's rollups and new progress records
+    queries = [
+        analytics_collection("video_progress").aggregate(_dashboard_progress_pipeline(user_email, last_watched)).to_list(1),
+        analytics_collection("categories").find({}, {"_id": 0, "id": 1, "name": 1}).to_list(None),
+        analytics_collection("videos").aggregate(_category_video_counts_pipeline()).to_list(None)
+    ]
+    if last_watched:
+        granularity, buckets = rollup_buckets(last_watched)
+        queries += [
+            analytics_collection("watch_rollups").aggregate([
+                {"$match": {"scope": "user", "key": user_email, **buckets}},
+                {"$group": {"_id": None, **_sum_fields()}}
+            ]).to_list(1),
+            analytics_collection("video_progress").count_documents({"user_email": user_email, "created_at": last_watched})
+        ]
+    facets, categories, video_counts, *ranged_results = await asyncio.gather(*queries)
+    facets = facets[0] if facets else {"totals": [], "recent": [], "by_category": []}
     
-    for progress in recent_progress:
-        video = await db.videos.find_one({"id": progress["video_id"]})
-        if video:
-            video_stats = await calculate_video_stats(progress["video_id"])
-            video_with_stats = VideoWithStats(**video, stats=video_stats)
-            recent_videos.append(video_with_stats)
+    totals = facets["totals"][0] if facets["totals"] else {}
+    total_videos_watched = totals.get("watched", 0)
+    total_videos_completed = totals.get("completed", 0)
+    total_watch_time = totals.get("watch_time", 0)
+    
+    period = None
+    if last_watched:
+        ranged, new_progress_records = ranged_results
+        ranged = ranged[0] if ranged else {}
+        total_videos_watched = ranged.get("views", 0)
+        total_videos_completed = ranged.get("completions", 0)
+        total_watch_time = ranged.get("watch_time", 0)
+        period = {
+            "from": last_watched.get("$gte"),
+            "to": last_watched.get("$lt"),
+            "resolution": granularity,
+            "active_progress_records": totals.get("watched", 0),
+            "new_progress_records": new_progress_records
+        }
+    completion_rate = (total_videos_completed / total_videos_watched * 100) if total_videos_watched > 0 else 0
+    
+    recent_videos = [
+        VideoWithStats(**entry["video"], stats=_video_stats_from_document(entry["stats"][0] if entry["stats"] else None))
+        for entry in facets["recent"]
+    ]
     
     # Get progress by category
+    watched_by_category = {entry["_id"]: entry for entry in facets["by_category"]}
     progress_by_category = {}
-    categories = await db.categories.find().to_list(1000)
+    video_counts = {entry["_id"]: entry["total_videos"] for entry in video_counts}
     
     for category in categories:
-        category_videos = await db.videos.find({"categoryId": category["id"]}).to_list(1000)
-        category_video_ids = [v["id"] for v in category_videos]
-        
-        category_progress = [p for p in progress_list if p["video_id"] in category_video_ids]
-        watched_count = len(category_progress)
-        completed_count = sum(1 for p in category_progress if p.get("completed", False))
+        category_progress = watched_by_category.get(category["id"], {})
+        watched_count = category_progress.get("watched", 0)
+        completed_count = category_progress.get("completed", 0)
         
         progress_by_category[category["name"]] = {
-            "total_videos": len(category_videos),
+            "total_videos": video_counts.get(category["id"], 0),
             "watched_videos": watched_count,
             "completed_videos": completed_count,
             "completion_rate": (completed_count / watched_count * 100) if watched_count > 0 else 0
@@ -391,17 +1164,14 @@ async def get_user_dashboard(user_email: str):
         total_watch_time=total_watch_time,
         completion_rate=completion_rate,
         recent_videos=recent_videos,
-        progress_by_category=progress_by_category
+        progress_by_category=progress_by_category,
+        range=period
     )
 
-# Helper function to calculate video statistics
-async def calculate_video_stats(video_id: str) -> VideoStats:
-    progress_list = await db.video_progress.find({"video_id": video_id}).to_list(1000)
-    
-    total_views = len(progress_list)
-    total_completions = sum(1 for p in progress_list if p.get("completed", False))
+# Helper function to build video statistics from aggregated totals
+def _video_stats_from_totals(total_views: int, total_completions: int, total_watch_time: int) -> VideoStats:
     average_completion_rate = (total_completions / total_views * 100) if total_views > 0 else 0
-    average_watch_time = sum(p.get("watch_time", 0) for p in progress_list) // total_views if total_views > 0 else 0
+    average_watch_time = total_watch_time // total_views if total_views > 0 else 0
     
     return VideoStats(
         total_views=total_views,
@@ -410,11 +1180,381 @@ async def calculate_video_stats(video_id: str) -> VideoStats:
         average_watch_time=average_watch_time
     )
 
+def _video_stats_from_document(stats_doc: Optional[Dict[str, Any]]) -> VideoStats:
+    stats_doc = stats_doc or {}
+    return _video_stats_from_totals(
+        stats_doc.get("total_views", 0),
+        stats_doc.get("total_completions", 0),
+        stats_doc.get("total_watch_time", 0)
+    )
+
+# Helper function to calculate video statistics from the materialized video_stats document
+async def calculate_video_stats(video_id: str) -> VideoStats:
+    stats_doc = await analytics_collection("video_stats").find_one({"video_id": video_id})
+    return _video_stats_from_document(stats_doc)
+
+# Change in video_stats caused by a progress record going from `before` to `after`.
+# `before` is None when the record was just created.
+def _video_stats_delta(before: Optional[Dict[str, Any]], after: Dict[str, Any]) -> Dict[str, int]:
+    created = before is None
+    before = before or {}
+    delta = {
+        "total_views": 1 if created else 0,
+        "total_completions": int(bool(after.get("completed", False))) - int(bool(before.get("completed", False))),
+        "total_watch_time": after.get("watch_time", 0) - before.get("watch_time", 0)
+    }
+    return {field: value for field, value in delta.items() if value}
+
+# Keep video_stats in sync with a single progress change
+async def apply_video_stats_delta(video_id: str, before: Optional[Dict[str, Any]], after: Dict[str, Any]):
+    delta = _video_stats_delta(before, after)
+    if not delta:
+        return
+    
+    await db.video_stats.update_one({"video_id": video_id}, {"$inc": delta}, upsert=True)
+
+# Keep video_stats in sync with many progress changes using one bulk write
+async def apply_video_stats_deltas(changes: List[tuple]):
+    totals: Dict[str, Dict[str, int]] = {}
+    for video_id, before, after in changes:
+        video_totals = totals.setdefault(video_id, {})
+        for field, value in _video_stats_delta(before, after).items():
+            video_totals[field] = video_totals.get(field, 0) + value
+    
+    operations = [
+        UpdateOne({"video_id": video_id}, {"$inc": delta}, upsert=True)
+        for video_id, delta in totals.items()
+        if any(delta.values())
+    ]
+    if operations:
+        await db.video_stats.bulk_write(operations, ordered=False)
+
+# Recompute the whole video_stats collection from video_progress
+async def rebuild_video_stats() -> int:
+    totals = await db.video_progress.aggregate([
+        {"$group": {
+            "_id": "$video_id",
+            "total_views": {"$sum": 1},
+            "total_completions": {"$sum": {"$cond": ["$completed", 1, 0]}},
+            "total_watch_time": {"$sum": "$watch_time"}
+        }}
+    ]).to_list(None)
+    
+    operations = [
+        ReplaceOne(
+            {"video_id": entry["_id"]},
+            {
+                "video_id": entry["_id"],
+                "total_views": entry["total_views"],
+                "total_completions": entry["total_completions"],
+                "total_watch_time": entry["total_watch_time"]
+            },
+            upsert=True
+        )
+        for entry in totals
+    ]
+    if operations:
+        await db.video_stats.bulk_write(operations, ordered=False)
+    await db.video_stats.delete_many({"video_id": {"$nin": [entry["_id"] for entry in totals]}})
+    return len(operations)
+
 @api_router.get("/video-stats/{video_id}")
 async def get_video_stats(video_id: str):
     stats = await calculate_video_stats(video_id)
     return stats
 
+@api_router.post("/admin/video-stats/rebuild")
+async def rebuild_video_stats_endpoint():
+    rebuilt = await rebuild_video_stats()
+    return {"message": "Estadísticas de videos recalculadas exitosamente", "videos": rebuilt}
+
+# Watch events
+# Every progress change is also appended to `watch_events`, a time-series collection
+# (metaField: video_id/user_email) whose documents expire after WATCH_EVENTS_TTL_DAYS.
+# Each event carries the change it made to video_stats: watch_time seconds added, a
+# new view, a completion. Heartbeats merged by the batch endpoint or the write-behind
+# buffer are logged as one event per record written.
+#
+# The rollup stage periodically recomputes `watch_rollups`: one document per
+# (granularity hour|day, scope video|category|user, key, bucket start), so time-range
+# analytics read a few small documents instead of raw events. The user scope is keyed
+# by email and backs the per-user dashboard. A pass recomputes every hour bucket from
+# an hour before the watermark up to now - lag in full from the raw events, then
+# the day buckets those hours belong to from the hour buckets, and writes
+# them with $set. Rewriting a bucket is idempotent: a pass that fails half-way is
+# redone by the next one, since the watermark only moves once the writes succeeded.
+# Each bucket records the time it was computed up to and is only replaced by a later
+# computation, so concurrent passes on several workers cannot move it backwards.
+WATCH_EVENTS_COLLECTION = "watch_events"
+WATCH_ROLLUP_STATE_ID = "watch_events"
+WATCH_ROLLUP_LAG_SECONDS = 10  # margin for events still in flight when a pass starts
+# Events are stamped by the worker before the insert, so a slow insert or a worker
+# with a lagging clock can store an event behind the watermark. Each pass recomputes
+# this much history before the watermark to pick those up.
+WATCH_ROLLUP_RESCAN_SECONDS = 3600
+WATCH_ROLLUP_EPOCH = datetime(1970, 1, 1)
+WATCH_ROLLUP_FIELDS = ("watch_time", "views", "completions", "events")
+
+def _watch_event(video_id: str, before: Optional[Dict[str, Any]], after: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    delta = _video_stats_delta(before, after)
+    return {
+        "ts": now,
+        "meta": {"video_id": video_id, "user_email": after["user_email"]},
+        "watch_time": delta.get("total_watch_time", 0),
+        "view": delta.get("total_views", 0),
+        "completed": delta.get("total_completions", 0),
+        "progress_percentage": after.get("progress_percentage", 0.0)
+    }
+
+async def record_watch_events(changes: List[tuple]):
+    if not watch_events_enabled or not changes:
+        return
+    now = datetime.utcnow()
+    events = [_watch_event(video_id, before, after, now) for video_id, before, after in changes]
+    try:
+        await db[WATCH_EVENTS_COLLECTION].insert_many(events, ordered=False)
+    except PyMongoError as e:
+        # The progress itself is stored; only the history misses these events
+        logger.warning(f"Could not append {len(events)} watch events: {e}")
+
+# Create watch_events as a time-series collection with TTL expiry. Servers without
+# time-series support (MongoDB < 5.0) get a regular collection with a TTL index.
+async def ensure_watch_events_collection():
+    ttl_seconds = int(watch_events_ttl_days * 86400)
+    if WATCH_EVENTS_COLLECTION not in await db.list_collection_names():
+        try:
+            await db.create_collection(
+                WATCH_EVENTS_COLLECTION,
+                timeseries={"timeField": "ts", "metaField": "meta", "granularity": "minutes"},
+                expireAfterSeconds=ttl_seconds
+            )
+            return
+        except CollectionInvalid:
+            pass  # Created concurrently by another worker; check its TTL below
+        except PyMongoError as e:
+            logger.warning(f"Time-series collections unavailable ({e}); using a regular collection for watch events")
+    await sync_watch_events_ttl(ttl_seconds)
+
+# An existing collection keeps the TTL it was created with, so apply a changed
+# WATCH_EVENTS_TTL_DAYS with collMod
+async def sync_watch_events_ttl(ttl_seconds: int):
+    try:
+        cursor = await db.list_collections(filter={"name": WATCH_EVENTS_COLLECTION})
+        infos = await cursor.to_list(1)
+        options = infos[0].get("options", {}) if infos else {}
+        if "timeseries" in options:
+            current = options.get("expireAfterSeconds")
+            if current != ttl_seconds:
+                await db.command("collMod", WATCH_EVENTS_COLLECTION, expireAfterSeconds=ttl_seconds)
+                logger.info(f"watch_events TTL changed from {current} to {ttl_seconds} seconds")
+            return
+        
+        ttl_index = (await db[WATCH_EVENTS_COLLECTION].index_information()).get("ts_ttl")
+        if ttl_index is None:
+            await db[WATCH_EVENTS_COLLECTION].create_index([("ts", ASCENDING)], name="ts_ttl", expireAfterSeconds=ttl_seconds)
+        elif ttl_index.get("expireAfterSeconds") != ttl_seconds:
+            await db.command("collMod", WATCH_EVENTS_COLLECTION, index={"name": "ts_ttl", "expireAfterSeconds": ttl_seconds})
+            logger.info(f"watch_events TTL changed from {ttl_index.get('expireAfterSeconds')} to {ttl_seconds} seconds")
+    except PyMongoError as e:
+        logger.warning(f"Could not update the watch_events TTL: {e}")
+
+def _hour_start(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+def _day_start(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _date_parts(field: str) -> Dict[str, Any]:
+    return {"year": {"$year": field}, "month": {"$month": field}, "day": {"$dayOfMonth": field}}
+
+def _sum_fields() -> Dict[str, Any]:
+    return {field: {"$sum": f"${field}"} for field in WATCH_ROLLUP_FIELDS}
+
+# Rollup bucket filter covering a date_range(): day buckets for the whole days in
+# the range and hour buckets for the partial days at either end. A bound inside an
+# hour widens the range to that whole hour. Returns the finest granularity used and
+# the filter, to merge into a $match on watch_rollups.
+def rollup_buckets(period: Dict[str, datetime]) -> Tuple[str, Dict[str, Any]]:
+    start = _hour_start(period["$gte"]) if "$gte" in period else None
+    end = period.get("$lt")
+    # Whole days are [first_day, last_day); an open bound extends them
+    first_day = _day_start(start) if start is not None else None
+    if first_day is not None and first_day < start:
+        first_day += timedelta(days=1)
+    last_day = _day_start(end) if end is not None else None
+    
+    if first_day is not None and last_day is not None and first_day >= last_day:
+        return "hour", {"granularity": "hour", "bucket": {"$gte": start, "$lt": end}}
+    
+    clauses = [{"granularity": "day", "bucket": {
+        **({"$gte": first_day} if first_day is not None else {}),
+        **({"$lt": last_day} if last_day is not None else {})
+    }}]
+    if start is not None and start < first_day:
+        clauses.append({"granularity": "hour", "bucket": {"$gte": start, "$lt": first_day}})
+    if end is not None and last_day < end:
+        clauses.append({"granularity": "hour", "bucket": {"$gte": last_day, "$lt": end}})
+    if len(clauses) == 1:
+        return "day", clauses[0]
+    return "hour", {"$or": clauses}
+
+def require_watch_rollups():
+    if not watch_events_enabled:
+        raise HTTPException(status_code=503, detail="Los rangos de fechas requieren WATCH_EVENTS_ENABLED")
+
+# Replace rollup buckets with recomputed totals, skipping buckets another pass already
+# computed further (their guarded upsert collides with the unique index)
+async def _write_rollups(granularity: str, rollups: Dict[tuple, Dict[str, int]], computed_until: datetime):
+    operations = [
+        UpdateOne(
+            {"granularity": granularity, "scope": scope, "key": key, "bucket": bucket,
+             "computed_until": {"$not": {"$gte": computed_until}}},
+            {"$set": {**totals, "computed_until": computed_until}},
+            upsert=True
+        )
+        for (scope, key, bucket), totals in rollups.items()
+    ]
+    if not operations:
+        return
+    try:
+        await db.watch_rollups.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        if e.details.get("writeConcernErrors") or any(
+            error.get("code") != 11000 for error in e.details.get("writeErrors", [])
+        ):
+            raise
+
+# Recompute the rollup buckets touched since the watermark. Returns the number of
+# rollup documents written.
+async def roll_up_watch_events() -> int:
+    state = await db.watch_rollup_state.find_one({"_id": WATCH_ROLLUP_STATE_ID})
+    start = (
+        _hour_start(state["watermark"] - timedelta(seconds=WATCH_ROLLUP_RESCAN_SECONDS)) if state else WATCH_ROLLUP_EPOCH
+    )
+    end = datetime.utcnow() - timedelta(seconds=WATCH_ROLLUP_LAG_SECONDS)
+    if end <= start:
+        return 0
+    
+    # Every event of the hours in [start, end), not just the new ones, so each hour
+    # bucket is rebuilt in full
+    events_by_hour = await db[WATCH_EVENTS_COLLECTION].aggregate([
+        {"$match": {"ts": {"$gte": start, "$lt": end}}},
+        {"$group": {
+            "_id": {
+                "video_id": "$meta.video_id",
+                "user_email": "$meta.user_email",
+                **_date_parts("$ts"),
+                "hour": {"$hour": "$ts"}
+            },
+            "watch_time": {"$sum": "$watch_time"},
+            "views": {"$sum": "$view"},
+            "completions": {"$sum": "$completed"},
+            "events": {"$sum": 1}
+        }}
+    ]).to_list(None)
+    
+    video_ids = list({entry["_id"]["video_id"] for entry in events_by_hour})
+    category_by_video = {
+        video["id"]: video["categoryId"]
+        async for video in db.videos.find({"id": {"$in": video_ids}}, {"_id": 0, "id": 1, "categoryId": 1})
+    }
+    
+    hourly: Dict[tuple, Dict[str, int]] = {}
+    for entry in events_by_hour:
+        group = entry["_id"]
+        video_id = group["video_id"]
+        hour = datetime(group["year"], group["month"], group["day"], group["hour"])
+        keys = [("video", video_id), ("user", group["user_email"])]
+        if video_id in category_by_video:
+            keys.append(("category", category_by_video[video_id]))
+        for scope, key in keys:
+            bucket_totals = hourly.setdefault((scope, key, hour), dict.fromkeys(WATCH_ROLLUP_FIELDS, 0))
+            for field in WATCH_ROLLUP_FIELDS:
+                bucket_totals[field] += entry[field]
+    await _write_rollups("hour", hourly, end)
+    
+    # Day buckets are the sum of their hour buckets, including hours finished earlier
+    days = {(scope, key, hour.replace(hour=0)) for scope, key, hour in hourly}
+    daily: Dict[tuple, Dict[str, int]] = {}
+    if days:
+        hour_sums = await db.watch_rollups.aggregate([
+            {"$match": {
+                "granularity": "hour",
+                "key": {"$in": list({key for _, key, _ in days})},
+                "bucket": {"$gte": min(day for _, _, day in days), "$lt": end}
+            }},
+            {"$group": {"_id": {"scope": "$scope", "key": "$key", **_date_parts("$bucket")}, **_sum_fields()}}
+        ]).to_list(None)
+        for entry in hour_sums:
+            group = entry["_id"]
+            bucket = (group["scope"], group["key"], datetime(group["year"], group["month"], group["day"]))
+            if bucket in days:
+                daily[bucket] = {field: entry[field] for field in WATCH_ROLLUP_FIELDS}
+        await _write_rollups("day", daily, end)
+    
+    await db.watch_rollup_state.update_one(
+        {"_id": WATCH_ROLLUP_STATE_ID},
+        {"$max": {"watermark": end}, "$set": {"updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+    return len(hourly) + len(daily)
+
+async def watch_rollup_worker():
+    while True:
+        await asyncio.sleep(watch_rollup_interval_seconds)
+        try:
+            await roll_up_watch_events()
+        except Exception as e:
+            logger.warning(f"Watch event rollup failed: {e}")
+
+@app.on_event("startup")
+async def start_watch_events():
+    if not watch_events_enabled:
+        return
+    await ensure_watch_events_collection()
+    start_background_task(watch_rollup_worker(), "watch-rollups")
+
+@api_router.post("/admin/watch-rollups/run")
+async def run_watch_rollup():
+    updated = await roll_up_watch_events()
+    return {"message": "Resúmenes de visualización actualizados", "rollups": updated}
+
+# Watch time per hour or day for videos, categories or users, read from the rollups.
+# Events from the last WATCH_ROLLUP_INTERVAL_SECONDS (+ lag) are not rolled up yet.
+@api_router.get("/admin/watch-time")
+async def get_watch_time(
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    scope: str = Query("category", pattern="^(video|category|user)$"),
+    key: Optional[str] = None,
+    from_: Optional[datetime] = RangeFrom,
+    to: Optional[datetime] = RangeTo
+):
+    query: Dict[str, Any] = {"granularity": granularity, "scope": scope}
+    if key is not None:
+        query["key"] = key
+    bucket_range = date_range(from_, to)
+    if bucket_range:
+        query["bucket"] = bucket_range
+    
+    rollups = await analytics_collection("watch_rollups").find(query, {"_id": 0}).sort(
+        [("bucket", ASCENDING), ("key", ASCENDING)]
+    ).to_list(None)
+    return {
+        "granularity": granularity,
+        "scope": scope,
+        "series": [
+            {
+                "bucket": rollup["bucket"],
+                "key": rollup["key"],
+                "watch_time": rollup.get("watch_time", 0),
+                "views": rollup.get("views", 0),
+                "completions": rollup.get("completions", 0),
+                "events": rollup.get("events", 0)
+            }
+            for rollup in rollups
+        ]
+    }
+
 # Enhanced video endpoint with statistics
 @api_router.get("/videos/{video_id}/detailed")
 async def get_video_detailed(video_id: str):
@@ -426,7 +1566,7 @@ async def get_video_detailed(video_id: str):
     return VideoWithStats(**video, stats=stats)
 
 # User management endpoints
-@api_router.post("/users", response_model=User)
+@api_router.post("/users", response_model=UserPublic)
 async def create_user(user_create: UserCreate):
     # Check if user already exists
     existing_user = await db.users.find_one({"email": user_create.email})
@@ -434,43 +1574,115 @@ async def create_user(user_create: UserCreate):
         raise HTTPException(status_code=400, detail="El usuario ya existe")
     
     user_dict = user_create.dict()
+    user_dict["password"] = await _password_call(password_hasher.hash(user_create.password))
     user_obj = User(**user_dict)
-    await db.users.insert_one(user_obj.dict())
-    return user_obj
+    try:
+        await db.users.insert_one(user_obj.dict())
+    except DuplicateKeyError:
+        # Registered concurrently since the check above; the unique email index rejected it
+        raise HTTPException(status_code=400, detail="El usuario ya existe")
+    note_stats_write()
+    return UserPublic(**user_obj.dict())
 
-@api_router.get("/users", response_model=List[User])
-async def get_users():
-    users = await db.users.find().to_list(1000)
-    return [User(**user) for user in users]
+@api_router.get("/users", response_model=Union[List[UserPublic], Page[UserPublic]])
+async def get_users(limit: Optional[int] = PageLimit, after: Optional[str] = None, format: str = ListFormat):
+    # Password hashes are projected away in the query itself
+    if format == "ndjson":
+        return ndjson_response(db.users, {}, "id", UserPublic, limit, after, fields=USER_PUBLIC_FIELDS)
+    projection = field_projection(USER_PUBLIC_FIELDS)
+    if _is_paginated(limit, after):
+        items, next_cursor = await fetch_page(db.users, {}, "id", limit, after, projection)
+        return Page[UserPublic](items=items, next_cursor=next_cursor)
+    users = await db.users.find({}, projection).to_list(1000)
+    return [UserPublic(**user) for user in users]
 
 @api_router.delete("/users/{user_id}")
 async def delete_user(user_id: str):
     result = await db.users.delete_one({"id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    note_stats_write()
     return {"message": "Usuario eliminado exitosamente"}
 
 # Category management endpoints
-@api_router.get("/categories", response_model=List[Category])
-async def get_categories():
-    categories = await db.categories.find().to_list(1000)
-    if not categories:
+@api_router.get("/categories", response_model=Union[List[Category], Page[Category]])
+async def get_categories(
+    include_videos: bool = True,
+    videos_limit: Optional[int] = Query(None, ge=1),
+    limit: Optional[int] = PageLimit,
+    after: Optional[str] = None,
+    fields: Optional[str] = FieldsParam,
+    view: str = ViewParam
+):
+    # fields/view select the fields of the nested videos
+    video_fields = requested_fields(Video, fields, view, VIDEO_SUMMARY_FIELDS)
+    paginated = _is_paginated(limit, after)
+    projection = field_projection(video_fields, "categoryId")
+    limited = include_videos and videos_limit is not None
+    # With videos_limit the first videos_limit videos of each category by id are joined
+    # in the same round-trip; each sub-pipeline is an index walk on (categoryId, id)
+    video_stages = [{"$lookup": {
+        "from": "videos",
+        "let": {"category_id": "$id"},
+        "pipeline": [
+            {"$match": {"$expr": {"$eq": ["$categoryId", "$$category_id"]}}},
+            {"$sort": {"id": 1}},
+            {"$limit": videos_limit},
+            {"$project": projection}
+        ],
+        "as": "videos"
+    }}] if limited else []
+    next_cursor = None
+    if paginated:
+        categories, next_cursor = await fetch_page(db.categories, {}, "id", limit, after, stages=video_stages)
+    elif limited:
+        categories = await db.categories.aggregate([{"$project": {"_id": 0}}, *video_stages]).to_list(1000)
+    else:
+        categories = await db.categories.find({}, {"_id": 0}).to_list(1000)
+    if not categories and after is None:
         # Initialize with default categories if none exist
         await initialize_default_categories()
-        categories = await db.categories.find().to_list(1000)
+        return await get_categories(include_videos, videos_limit, limit, after, fields, view)
     
-    # Get videos for each category
-    for category in categories:
-        category_videos = await db.videos.find({"categoryId": category["id"]}).to_list(1000)
-        category["videos"] = [Video(**video) for video in category_videos]
+    videos_by_category = {category["id"]: category["videos"] if limited else [] for category in categories}
+    if include_videos and categories and not limited:
+        # Fetch the videos in one query and group them by category in memory
+        video_query = {"categoryId": {"$in": list(videos_by_category)}} if paginated else {}
+        async for video in db.videos.find(video_query, projection):
+            category_videos = videos_by_category.get(video.get("categoryId"))
+            if category_videos is not None:
+                category_videos.append(video)
     
-    return [Category(**category) for category in categories]
+    for category in categories:
+        category["videos"] = videos_by_category[category["id"]]
+        if video_fields is not None:
+            category["videos"] = [pick_fields(video, video_fields) for video in category["videos"]]
+    category_fields = list(Category.model_fields) if video_fields is not None else None
+    return trusted_response(Category, categories, paginated=paginated, next_cursor=next_cursor, fields=category_fields)
+
+@api_router.get("/categories/{category_id}/videos", response_model=Union[List[Video], Page[Video]])
+async def get_category_videos(
+    category_id: str,
+    limit: Optional[int] = PageLimit,
+    after: Optional[str] = None,
+    fields: Optional[str] = FieldsParam,
+    view: str = ViewParam
+):
+    video_fields = requested_fields(Video, fields, view, VIDEO_SUMMARY_FIELDS)
+    projection = field_projection(video_fields)
+    if _is_paginated(limit, after):
+        items, next_cursor = await fetch_page(db.videos, {"categoryId": category_id}, "id", limit, after, projection)
+        return trusted_response(Video, items, paginated=True, next_cursor=next_cursor, fields=video_fields)
+    videos = await db.videos.find({"categoryId": category_id}, projection).to_list(1000)
+    return trusted_response(Video, videos, fields=video_fields)
 
 @api_router.post("/categories", response_model=Category)
 async def create_category(category_create: CategoryCreate):
     category_dict = category_create.dict()
     category_obj = Category(**category_dict)
     await db.categories.insert_one(category_obj.dict())
+    await collection_changed("categories")
+    note_stats_write()
     return category_obj
 
 @api_router.put("/categories/{category_id}")
@@ -481,6 +1693,8 @@ async def update_category(category_id: str, category_update: CategoryCreate):
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
+    await collection_changed("categories")
+    note_stats_write()
     return {"message": "Categoría actualizada exitosamente"}
 
 @api_router.delete("/categories/{category_id}")
@@ -488,19 +1702,36 @@ async def delete_category(category_id: str):
     result = await db.categories.delete_one({"id": category_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Categoría no encontrada")
+    await collection_changed("categories")
+    note_stats_write()
     return {"message": "Categoría eliminada exitosamente"}
 
 # Video management endpoints
-@api_router.get("/videos", response_model=List[Video])
-async def get_all_videos():
-    videos = await db.videos.find().to_list(1000)
-    return [Video(**video) for video in videos]
+@api_router.get("/videos", response_model=Union[List[Video], Page[Video]])
+async def get_all_videos(
+    limit: Optional[int] = PageLimit,
+    after: Optional[str] = None,
+    format: str = ListFormat,
+    fields: Optional[str] = FieldsParam,
+    view: str = ViewParam
+):
+    video_fields = requested_fields(Video, fields, view, VIDEO_SUMMARY_FIELDS)
+    if format == "ndjson":
+        return ndjson_response(db.videos, {}, "id", Video, limit, after, video_fields)
+    projection = field_projection(video_fields)
+    if _is_paginated(limit, after):
+        items, next_cursor = await fetch_page(db.videos, {}, "id", limit, after, projection)
+        return trusted_response(Video, items, paginated=True, next_cursor=next_cursor, fields=video_fields)
+    videos = await db.videos.find({}, projection).to_list(1000)
+    return trusted_response(Video, videos, fields=video_fields)
 
 @api_router.post("/videos", response_model=Video)
 async def create_video(video_create: VideoCreate):
     video_dict = video_create.dict()
     video_obj = Video(**video_dict)
     await db.videos.insert_one(video_obj.dict())
+    await collection_changed("videos")
+    note_stats_write()
     return video_obj
 
 @api_router.put("/videos/{video_id}")
@@ -513,6 +1744,8 @@ async def update_video(video_id: str, video_update: VideoCreate):
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Video no encontrado")
     
+    await collection_changed("videos")
+    note_stats_write()
     return {"message": "Video actualizado exitosamente"}
 
 @api_router.delete("/videos/{video_id}")
@@ -522,11 +1755,11 @@ async def delete_video(video_id: str):
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Video no encontrado")
     
+    await collection_changed("videos")
+    note_stats_write()
     return {"message": "Video eliminado exitosamente"}
 
-# Settings management endpoints
-@api_router.get("/settings", response_model=Settings)
-async def get_settings():
+async def load_settings() -> Settings:
     settings = await db.settings.find_one()
     if not settings:
         # Create default settings if none exist
@@ -535,6 +1768,27 @@ async def get_settings():
         return default_settings
     return Settings(**settings)
 
+async def load_banner_video() -> Optional[BannerVideo]:
+    banner_video = await db.banner_videos.find_one()
+    if not banner_video:
+        return None
+    return BannerVideo(**banner_video)
+
+@api_router.get("/admin/pool-stats")
+async def get_pool_stats():
+    if client is None:
+        return {"backend": "memory", "pools": {}}
+    return {"backend": "mongo", "options": mongo_client_options(), "pools": connection_pool_stats.stats()}
+
+@api_router.get("/admin/cache-stats")
+async def get_cache_stats():
+    return cache_stats()
+
+# Settings management endpoints
+@api_router.get("/settings", response_model=Settings)
+async def get_settings():
+    return await settings_cache.get("settings", load_settings)
+
 @api_router.put("/settings", response_model=Settings)
 async def update_settings(settings_update: SettingsUpdate):
     # Get current settings or create default
@@ -552,6 +1806,8 @@ async def update_settings(settings_update: SettingsUpdate):
         upsert=True
     )
     
+    await collection_changed("settings")
+    
     # Return updated settings
     updated_settings = await db.settings.find_one()
     return Settings(**updated_settings)
@@ -559,10 +1815,7 @@ async def update_settings(settings_update: SettingsUpdate):
 # Banner video endpoints
 @api_router.get("/banner-video")
 async def get_banner_video():
-    banner_video = await db.banner_videos.find_one()
-    if not banner_video:
-        return None
-    return BannerVideo(**banner_video)
+    return await banner_video_cache.get("banner_video", load_banner_video)
 
 @api_router.post("/banner-video", response_model=BannerVideo)
 async def set_banner_video(banner_video_create: BannerVideoCreate):
@@ -572,65 +1825,138 @@ async def set_banner_video(banner_video_create: BannerVideoCreate):
     # Replace existing banner video
     await db.banner_videos.delete_many({})
     await db.banner_videos.insert_one(banner_video_obj.dict())
+    await collection_changed("banner_videos")
     
     return banner_video_obj
 
 @api_router.delete("/banner-video")
 async def delete_banner_video():
     result = await db.banner_videos.delete_many({})
+    await collection_changed("banner_videos")
     return {"message": "Banner video eliminado exitosamente"}
 
-# Admin Statistics Endpoint
-@api_router.get("/admin/stats")
-async def get_admin_stats():
-    # Get total counts
-    total_users = len(await db.users.find().to_list(1000))
-    total_videos = len(await db.videos.find().to_list(1000))
-    total_categories = len(await db.categories.find().to_list(1000))
-    
-    # Get progress statistics
-    all_progress = await db.video_progress.find().to_list(10000)
-    total_video_views = len(all_progress)
-    total_completions = sum(1 for p in all_progress if p.get("completed", False))
-    total_watch_time = sum(p.get("watch_time", 0) for p in all_progress)
-    
-    # Get most watched videos
-    video_view_counts = {}
-    for progress in all_progress:
-        video_id = progress["video_id"]
-        video_view_counts[video_id] = video_view_counts.get(video_id, 0) + 1
-    
-    # Get top 5 most watched videos
-    top_videos = sorted(video_view_counts.items(), key=lambda x: x[1], reverse=True)[:5]
-    top_videos_detailed = []
-    
-    for video_id, view_count in top_videos:
-        video = await db.videos.find_one({"id": video_id})
-        if video:
-            stats = await calculate_video_stats(video_id)
-            top_videos_detailed.append({
-                "video": VideoWithStats(**video, stats=stats),
-                "view_count": view_count
-            })
-    
-    # Get completion rate by category
-    categories = await db.categories.find().to_list(1000)
+# Admin Statistics
+# The statistics are computed with server-side counts/aggregations and stored as a
+# snapshot document, which a background task refreshes periodically or once enough
+# writes have happened since the last refresh.
+ADMIN_STATS_SNAPSHOT_ID = "admin_stats"
+admin_stats_writes_since_refresh = 0
+admin_stats_refresh_requested = asyncio.Event()
+
+def note_stats_write(count: int = 1):
+    global admin_stats_writes_since_refresh
+    admin_stats_writes_since_refresh += count
+    if admin_stats_writes_since_refresh >= admin_stats_write_threshold:
+        admin_stats_refresh_requested.set()
+
+# Per-category stats keyed by category name, from totals keyed by category id
+async def _category_stats(category_totals: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    categories = await analytics_collection("categories").find({}, {"_id": 0, "id": 1, "name": 1}).to_list(None)
     category_stats = {}
     
     for category in categories:
-        category_videos = await db.videos.find({"categoryId": category["id"]}).to_list(1000)
-        category_video_ids = [v["id"] for v in category_videos]
-        
-        category_progress = [p for p in all_progress if p["video_id"] in category_video_ids]
-        watched_count = len(category_progress)
-        completed_count = sum(1 for p in category_progress if p.get("completed", False))
+        category_total = category_totals.get(category["id"], {})
+        watched_count = category_total.get("total_views", 0)
+        completed_count = category_total.get("total_completions", 0)
         
         category_stats[category["name"]] = {
-            "total_videos": len(category_videos),
+            "total_videos": category_total.get("total_videos", 0),
             "total_views": watched_count,
             "total_completions": completed_count,
             "completion_rate": (completed_count / watched_count * 100) if watched_count > 0 else 0
         }
+    return category_stats
+
+# Most watched videos by all-time views. video_stats.total_views is incremented on
+# the first progress for a (user, video) pair, and the total_views index serves the
+# sort + limit without scanning the collection.
+async def top_videos_by_views(limit: int) -> List[Dict[str, Any]]:
+    top_videos = await analytics_collection("video_stats").aggregate([
+        {"$sort": {"total_views": -1, "video_id": 1}},
+        {"$limit": limit},
+        {"$lookup": {"from": "videos", "localField": "video_id", "foreignField": "id", "as": "video"}},
+        {"$unwind": "$video"}
+    ]).to_list(None)
+    return [
+        {
+            "video": VideoWithStats(**entry["video"], stats=_video_stats_from_document(entry)).dict(),
+            "view_count": entry["total_views"]
+        }
+        for entry in top_videos
+    ]
+
+# Trending videos: new views decayed exponentially with age, so a view loses half
+# its weight every TRENDING_HALF_LIFE_HOURS. Scores are computed from the daily
+# per-video watch rollups (day resolution) over the last TRENDING_WINDOW_HALF_LIVES
+# half-lives; older views would weigh less than 1/16 and are ignored.
+TRENDING_WINDOW_HALF_LIVES = 4
+
+async def trending_videos(limit: int, now: datetime) -> List[Dict[str, Any]]:
+    decay_per_ms = math.log(2) / (trending_half_life_hours * 3600 * 1000)
+    since = (now - timedelta(hours=trending_half_life_hours * TRENDING_WINDOW_HALF_LIVES)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    age_ms = {"$subtract": [now, "$bucket"]}
+    trending = await analytics_collection("watch_rollups").aggregate([
+        {"$match": {"granularity": "day", "scope": "video", "bucket": {"$gte": since}}},
+        {"$group": {
+            "_id": "$key",
+            "trending_score": {"$sum": {"$multiply": ["$views", {"$exp": {"$multiply": [-decay_per_ms, age_ms]}}]}},
+            "recent_views": {"$sum": "$views"}
+        }},
+        {"$match": {"trending_score": {"$gt": 0}}},
+        {"$sort": {"trending_score": -1, "_id": 1}},
+        {"$limit": limit},
+        {"$lookup": {"from": "videos", "localField": "_id", "foreignField": "id", "as": "video"}},
+        {"$unwind": "$video"},
+        {"$lookup": {"from": "video_stats", "localField": "_id", "foreignField": "video_id", "as": "stats"}}
+    ]).to_list(None)
+    return [
+        {
+            "video": VideoWithStats(
+                **entry["video"], stats=_video_stats_from_document(entry["stats"][0] if entry["stats"] else None)
+            ).dict(),
+            "trending_score": round(entry["trending_score"], 3),
+            "recent_views": entry["recent_views"]
+        }
+        for entry in trending
+    ]
+
+async def compute_admin_stats() -> Dict[str, Any]:
+    # Get total counts
+    total_users = await analytics_collection("users").count_documents({})
+    total_videos = await analytics_collection("videos").count_documents({})
+    total_categories = await analytics_collection("categories").count_documents({})
+    
+    # Progress totals come from the materialized per-video statistics
+    totals = await analytics_collection("video_stats").aggregate([
+        {"$group": {
+            "_id": None,
+            "total_video_views": {"$sum": "$total_views"},
+            "total_completions": {"$sum": "$total_completions"},
+            "total_watch_time": {"$sum": "$total_watch_time"}
+        }}
+    ]).to_list(1)
+    totals = totals[0] if totals else {}
+    total_video_views = totals.get("total_video_views", 0)
+    total_completions = totals.get("total_completions", 0)
+    total_watch_time = totals.get("total_watch_time", 0)
+    
+    # Get top 5 most watched videos
+    top_videos_detailed = await top_videos_by_views(5)
+    
+    # Get completion rate by category
+    category_totals = await analytics_collection("videos").aggregate([
+        {"$lookup": {"from": "video_stats", "localField": "id", "foreignField": "video_id", "as": "stats"}},
+        {"$unwind": {"path": "$stats", "preserveNullAndEmptyArrays": True}},
+        {"$group": {
+            "_id": "$categoryId",
+            "total_videos": {"$sum": 1},
+            "total_views": {"$sum": "$stats.total_views"},
+            "total_completions": {"$sum": "$stats.total_completions"}
+        }}
+    ]).to_list(None)
+    category_stats = await _category_stats({entry["_id"]: entry for entry in category_totals})
     
     return {
         "overview": {
@@ -646,6 +1972,183 @@ async def get_admin_stats():
         "category_stats": category_stats
     }
 
+# Statistics for a time range. Views, completions and watch time are what happened
+# inside the range (new views, completions reached, seconds added), summed from the
+# watch rollups of the range; see rollup_buckets() for the resolution. Progress
+# records are only counted: active ones were last watched in the range, new ones
+# created in it. Catalogue counts stay all-time.
+async def compute_ranged_admin_stats(period: Dict[str, datetime]) -> Dict[str, Any]:
+    total_users = await analytics_collection("users").count_documents({})
+    total_videos = await analytics_collection("videos").count_documents({})
+    total_categories = await analytics_collection("categories").count_documents({})
+    new_users = await analytics_collection("users").count_documents({"created_at": period})
+    active_progress_records = await analytics_collection("video_progress").count_documents({"last_watched": period})
+    new_progress_records = await analytics_collection("video_progress").count_documents({"created_at": period})
+    
+    granularity, buckets = rollup_buckets(period)
+    facets = await analytics_collection("watch_rollups").aggregate([
+        {"$match": {"scope": {"$in": ["video", "category"]}, **buckets}},
+        {"$group": {"_id": {"scope": "$scope", "key": "$key"}, **_sum_fields()}},
+        {"$facet": {
+            "totals": [
+                {"$match": {"_id.scope": "video"}},
+                {"$group": {"_id": None, **_sum_fields()}}
+            ],
+            "top": [
+                {"$match": {"_id.scope": "video", "views": {"$gt": 0}}},
+                {"$sort": {"views": -1, "_id.key": 1}},
+                {"$limit": 5},
+                {"$lookup": {"from": "videos", "localField": "_id.key", "foreignField": "id", "as": "video"}},
+                {"$unwind": "$video"}
+            ],
+            "by_category": [
+                {"$match": {"_id.scope": "category"}}
+            ]
+        }}
+    ]).to_list(1)
+    facets = facets[0] if facets else {"totals": [], "top": [], "by_category": []}
+    totals = facets["totals"][0] if facets["totals"] else {}
+    total_video_views = totals.get("views", 0)
+    total_completions = totals.get("completions", 0)
+    
+    top_videos_detailed = [
+        {
+            "video": VideoWithStats(
+                **entry["video"],
+                stats=_video_stats_from_totals(entry["views"], entry["completions"], entry["watch_time"])
+            ).dict(),
+            "view_count": entry["views"]
+        }
+        for entry in facets["top"]
+    ]
+    
+    videos_per_category = await analytics_collection("videos").aggregate(_category_video_counts_pipeline()).to_list(None)
+    category_totals = {entry["_id"]: dict(entry) for entry in videos_per_category}
+    for entry in facets["by_category"]:
+        category_totals.setdefault(entry["_id"]["key"], {}).update(
+            total_views=entry["views"], total_completions=entry["completions"]
+        )
+    
+    return {
+        "overview": {
+            "total_users": total_users,
+            "total_videos": total_videos,
+            "total_categories": total_categories,
+            "new_users": new_users,
+            "active_progress_records": active_progress_records,
+            "new_progress_records": new_progress_records,
+            "total_video_views": total_video_views,
+            "total_completions": total_completions,
+            "total_watch_time": totals.get("watch_time", 0),
+            "overall_completion_rate": (total_completions / total_video_views * 100) if total_video_views > 0 else 0
+        },
+        "top_videos": top_videos_detailed,
+        "category_stats": await _category_stats(category_totals),
+        "range": {"from": period.get("$gte"), "to": period.get("$lt"), "resolution": granularity}
+    }
+
+async def refresh_admin_stats_snapshot() -> Dict[str, Any]:
+    global admin_stats_writes_since_refresh
+    admin_stats_writes_since_refresh = 0
+    admin_stats_refresh_requested.clear()
+    
+    snapshot = {
+        "id": ADMIN_STATS_SNAPSHOT_ID,
+        "stats": await compute_admin_stats(),
+        "generated_at": datetime.utcnow()
+    }
+    await db.admin_stats_snapshots.replace_one({"id": ADMIN_STATS_SNAPSHOT_ID}, snapshot, upsert=True)
+    return snapshot
+
+async def admin_stats_refresher():
+    while True:
+        try:
+            await asyncio.wait_for(admin_stats_refresh_requested.wait(), timeout=admin_stats_refresh_seconds)
+        except asyncio.TimeoutError:
+            pass
+        try:
+            await refresh_admin_stats_snapshot()
+        except Exception as e:
+            logger.warning(f"Admin stats snapshot refresh failed: {e}")
+
+@app.on_event("startup")
+async def start_admin_stats_refresher():
+    start_background_task(admin_stats_refresher(), "admin-stats-refresher")
+
+# All-time statistics come from the snapshot; a ?from=&to= range is computed live
+@api_router.get("/admin/stats")
+async def get_admin_stats(refresh: bool = False, from_: Optional[datetime] = RangeFrom, to: Optional[datetime] = RangeTo):
+    period = date_range(from_, to)
+    if period:
+        require_watch_rollups()
+        return await compute_ranged_admin_stats(period)
+    
+    snapshot = None if refresh else await analytics_collection("admin_stats_snapshots").find_one({"id": ADMIN_STATS_SNAPSHOT_ID})
+    if not snapshot:
+        snapshot = await refresh_admin_stats_snapshot()
+    
+    return {
+        **snapshot["stats"],
+        "snapshot": {
+            "generated_at": snapshot["generated_at"],
+            "age_seconds": max((datetime.utcnow() - snapshot["generated_at"]).total_seconds(), 0.0)
+        }
+    }
+
+@api_router.get("/admin/top-videos")
+async def get_top_videos(
+    limit: int = Query(10, ge=1, le=100),
+    ranking: str = Query("views", pattern="^(views|trending)$")
+):
+    if ranking == "views":
+        return {"ranking": ranking, "videos": await top_videos_by_views(limit)}
+    
+    if not watch_events_enabled:
+        raise HTTPException(status_code=503, detail="Las tendencias requieren WATCH_EVENTS_ENABLED")
+    return {
+        "ranking": ranking,
+        "half_life_hours": trending_half_life_hours,
+        "videos": await trending_videos(limit, datetime.utcnow())
+    }
+
+# Scrape-time metrics for state owned by the caches and the write-behind buffer
+def _cache_metrics():
+    stats = cache_stats()
+    yield ("cache_hits_total", "counter", "Read-through cache hits", ("cache",),
+           [((name,), entry["hits"]) for name, entry in stats.items()])
+    yield ("cache_misses_total", "counter", "Read-through cache misses", ("cache",),
+           [((name,), entry["misses"]) for name, entry in stats.items()])
+    yield ("cache_hit_ratio", "gauge", "Read-through cache hit ratio since startup", ("cache",),
+           [((name,), entry["hit_ratio"]) for name, entry in stats.items()])
+
+def _write_buffer_metrics():
+    if progress_buffer is None:
+        return
+    stats = progress_buffer.stats()
+    yield ("progress_buffer_pending", "gauge", "Progress records waiting to be flushed", (), [((), stats["pending"])])
+    yield ("progress_buffer_accepted_total", "counter", "Progress heartbeats accepted by the buffer", (),
+           [((), stats["accepted"])])
+    yield ("progress_buffer_flushed_total", "counter", "Coalesced progress records written by flushes", (),
+           [((), stats["flushed"])])
+    yield ("progress_buffer_failed_flushes_total", "counter", "Write-behind flushes that failed", (),
+           [((), stats["failed_flushes"])])
+    yield ("progress_buffer_coalescing_ratio", "gauge", "Share of buffered heartbeats absorbed by coalescing", (),
+           [((), stats["coalescing_ratio"])])
+
+def _password_hasher_metrics():
+    stats = password_hasher.stats()
+    yield ("password_hash_pending", "gauge", "Password hash/verify jobs queued or running", (), [((), stats["pending"])])
+    yield ("password_hash_rejected_total", "counter", "Password hash/verify jobs rejected because the pool was saturated",
+           (), [((), stats["rejected"])])
+
+metrics_registry.add_collector(_cache_metrics)
+metrics_registry.add_collector(_password_hasher_metrics)
+metrics_registry.add_collector(_write_buffer_metrics)
+
+@api_router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return Response(content=metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Legacy endpoints for compatibility
 @api_router.get("/")
 async def root():
@@ -658,20 +2161,32 @@ async def create_status_check(input: StatusCheckCreate):
     _ = await db.status_checks.insert_one(status_obj.dict())
     return status_obj
 
-@api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
+@api_router.get("/status", response_model=Union[List[StatusCheck], Page[StatusCheck]])
+async def get_status_checks(limit: Optional[int] = PageLimit, after: Optional[str] = None, format: str = ListFormat):
+    if format == "ndjson":
+        return ndjson_response(db.status_checks, {}, "id", StatusCheck, limit, after)
+    if _is_paginated(limit, after):
+        items, next_cursor = await fetch_page(db.status_checks, {}, "id", limit, after)
+        return Page[StatusCheck](items=items, next_cursor=next_cursor)
     status_checks = await db.status_checks.find().to_list(1000)
     return [StatusCheck(**status_check) for status_check in status_checks]
 
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(ConditionalGetMiddleware, versions=collection_versions, routes=VERSIONED_ROUTES)
+
+app.add_middleware(MetricsMiddleware)
+
+app.add_middleware(QueryAccountingMiddleware, budget=db_query_budget)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Server-Timing", "X-DB-Queries"],
 )
 
 # Configure logging
@@ -683,4 +2198,18 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    # Let in-flight requests finish before the resources they use go away
+    deadline = time.monotonic() + shutdown_grace_seconds
+    while http_requests_in_flight.value() > 0 and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    if http_requests_in_flight.value() > 0:
+        logger.warning(f"Shutting down with {int(http_requests_in_flight.value())} requests still in flight")
+    
+    if progress_buffer is not None:
+        await progress_buffer.drain()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    password_hasher.shutdown()
+    if client is not None:
+        client.close()
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""In-process write-behind buffer.
+
+Records are coalesced per key (only the merged latest state is kept) and handed
+to a flush callback in bulk, either on a timer or once enough keys are pending.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FlushFn = Callable[[List[Tuple[Hashable, Dict[str, Any]]]], Awaitable[None]]
+MergeFn = Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]
+
+
+class WriteBehindBuffer:
+    def __init__(self, flush_fn: FlushFn, merge_fn: MergeFn, flush_interval: float, max_pending: int):
+        self.flush_fn = flush_fn
+        self.merge_fn = merge_fn
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[Hashable, Dict[str, Any]] = {}
+        # Records handed to flush_fn but not yet confirmed; still visible to readers
+        self._flushing: Dict[Hashable, Dict[str, Any]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flush_requested = asyncio.Event()
+        self._closed = False
+        self._pending_puts = 0
+
+        self.accepted = 0
+        self.accepted_flushed = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        record = self._pending.get(key)
+        return record if record is not None else self._flushing.get(key)
+
+    def put(self, key: Hashable, record: Dict[str, Any]) -> Dict[str, Any]:
+        current = self._pending.get(key)
+        if current is not None:
+            record = self.merge_fn(current, record)
+        self._pending[key] = record
+        self.accepted += 1
+        self._pending_puts += 1
+        if len(self._pending) >= self.max_pending:
+            self._flush_requested.set()
+        return record
+
+    async def flush(self):
+        async with self._flush_lock:
+            self._flush_requested.clear()
+            if not self._pending:
+                return
+            self._flushing, self._pending = self._pending, {}
+            batch = list(self._flushing.items())
+            puts, self._pending_puts = self._pending_puts, 0
+
+            started = time.perf_counter()
+            try:
+                await self.flush_fn(batch)
+            except Exception as e:
+                # Put the records back so the next flush retries them
+                self.failed_flushes += 1
+                self._pending_puts += puts
+                for key, record in batch:
+                    current = self._pending.get(key)
+                    self._pending[key] = record if current is None else self.merge_fn(record, current)
+                logger.warning(f"Write-behind flush of {len(batch)} records failed: {e}")
+                return
+            finally:
+                self._flushing = {}
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.flushes += 1
+            self.flushed += len(batch)
+            self.accepted_flushed += puts
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self.total_flush_ms += elapsed_ms
+
+    async def run(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def drain(self):
+        self._closed = True
+        self._flush_requested.set()
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "accepted": self.accepted,
+            "flushed": self.flushed,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            # Share of flushed writes that were absorbed by coalescing instead of hitting the database
+            "coalescing_ratio": (1 - self.flushed / self.accepted_flushed) if self.accepted_flushed else 0.0,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+        }
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Set before server is imported: its configuration is read at import time and
+# load_dotenv() does not override variables that are already set
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ["INVALIDATION_MODE"] = "off"
+os.environ["PROGRESS_WRITE_BEHIND"] = "false"
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """The server module with its per-process state reset for one app lifespan."""
+    import server as server_module
+    from passwords import PasswordHasher
+
+    # The shutdown handler closes the hasher's pool and asyncio primitives bind to the
+    # event loop of the first lifespan, so every test gets fresh ones
+    monkeypatch.setattr(server_module, "password_hasher", PasswordHasher(
+        server_module.password_hash_scheme,
+        server_module.password_hash_workers,
+        server_module.password_hash_max_pending
+    ))
+    monkeypatch.setattr(server_module, "admin_stats_refresh_requested", asyncio.Event())
+    monkeypatch.setattr(server_module, "background_tasks", [])
+    monkeypatch.setattr(server_module, "progress_buffer", None)
+    for caches in server_module.CACHES_BY_COLLECTION.values():
+        for cache in caches:
+            cache.invalidate()
+    return server_module
+
+
+@pytest.fixture
+def client(server):
+    from fastapi.testclient import TestClient
+
+    # Each lifespan starts on a new, empty in-memory database
+    with TestClient(server.app) as test_client:
+        yield test_client
+
+
+def create_videos(client):
+    """Three videos in each of the first two default categories."""
+    categories = client.get("/api/categories", params={"include_videos": "false"}).json()
+    created = []
+    for index in range(6):
+        response = client.post("/api/videos", json={
+            "title": f"Video {index}",
+            "description": "Descripción del video de prueba",
+            "thumbnail": "https://example.com/thumb.jpg",
+            "duration": "10:00",
+            "youtubeId": "dQw4w9WgXcQ",
+            "match": "95%",
+            "difficulty": "Principiante",
+            "rating": 4.5,
+            "views": 0,
+            "releaseDate": "2024",
+            "categoryId": categories[index % 2]["id"]
+        })
+        assert response.status_code == 200
+        created.append(response.json())
+    return created
+
+
+@pytest.fixture
+def videos_factory():
+    return create_videos
+
+
+@pytest.fixture
+def videos(client):
+    return create_videos(client)
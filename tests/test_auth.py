@@ -0,0 +1,62 @@
+import asyncio
+import json
+
+from passwords import PasswordHasher
+
+
+def login(client, email, password):
+    return client.post("/api/auth/login", json={"email": email, "password": password})
+
+
+def create_user(client, email="ana@example.com", password="secreto"):
+    response = client.post("/api/users", json={"email": email, "password": password, "name": "Ana"})
+    assert response.status_code == 200
+    return response.json()
+
+
+# Password hashing
+
+def test_password_hashes_never_leave_the_server(server, client):
+    created = create_user(client)
+    create_user(client, "beto@example.com")
+
+    assert "password" not in created
+    stored = asyncio.run(server.db.users.find_one({"email": "ana@example.com"}))
+    assert server.password_hasher.context.identify(stored["password"]) == server.password_hash_scheme
+    responses = [
+        client.get("/api/users").json(),
+        client.get("/api/users", params={"limit": 1}).json()["items"],
+        [json.loads(line) for line in client.get("/api/users", params={"format": "ndjson"}).text.splitlines()],
+    ]
+    for users in responses:
+        assert users and all("password" not in user for user in users)
+
+
+def test_login_rehashes_legacy_plaintext_passwords(server, client):
+    asyncio.run(server.db.users.insert_one({
+        "id": "u1", "email": "ana@example.com", "password": "secreto", "name": "Ana", "role": "user"
+    }))
+
+    assert login(client, "ana@example.com", "otro").status_code == 401
+    assert asyncio.run(server.db.users.find_one({"id": "u1"}))["password"] == "secreto"
+
+    assert login(client, "ana@example.com", "secreto").json() == {"role": "user", "email": "ana@example.com", "name": "Ana"}
+    stored = asyncio.run(server.db.users.find_one({"id": "u1"}))["password"]
+    assert server.password_hasher.context.identify(stored) == server.password_hash_scheme
+    assert login(client, "ana@example.com", "secreto").status_code == 200
+    assert asyncio.run(server.db.users.find_one({"id": "u1"}))["password"] == stored
+
+
+# Login timing
+
+def test_unknown_emails_are_verified_against_a_dummy_hash(server, client):
+    response = login(client, "nadie@example.com", "secreto")
+
+    assert response.status_code == 401
+    assert server.password_hasher.context.identify(server.password_hasher._dummy_hash) == server.password_hash_scheme
+
+
+def test_unknown_emails_wait_for_the_same_pool(server, client, monkeypatch):
+    monkeypatch.setattr(server, "password_hasher", PasswordHasher(server.password_hash_scheme, 1, 0))
+
+    assert login(client, "nadie@example.com", "secreto").status_code == 503
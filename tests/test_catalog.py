@@ -0,0 +1,68 @@
+def test_videos_limit_keeps_the_first_videos_of_each_category_in_one_query(client, videos):
+    client.get("/api/categories")  # creates the default categories
+
+    response = client.get("/api/categories", params={"videos_limit": 2, "view": "summary"})
+
+    assert response.status_code == 200
+    assert response.headers["X-DB-Queries"] == "1"
+    expected = {}
+    for video in videos:
+        expected.setdefault(video["categoryId"], []).append(video["id"])
+    for category in response.json():
+        assert [video["id"] for video in category["videos"]] == sorted(expected.get(category["id"], []))[:2]
+
+
+def test_videos_limit_with_pagination(client, videos):
+    first = client.get("/api/categories", params={"videos_limit": 1, "limit": 1}).json()
+    second = client.get("/api/categories", params={"videos_limit": 1, "limit": 1, "after": first["next_cursor"]}).json()
+
+    assert [category["id"] for category in first["items"] + second["items"]] == ["1", "2"]
+    assert [len(category["videos"]) for category in first["items"] + second["items"]] == [1, 1]
+
+
+# ETags
+
+def test_etag_answers_304_until_the_collection_changes(client, videos):
+    path = f"/api/categories/{videos[0]['categoryId']}/videos"
+    first = client.get(path)
+    etag = first.headers["ETag"]
+
+    cached = client.get(path, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    # Another query string is another representation
+    assert client.get(path, params={"view": "summary"}, headers={"If-None-Match": etag}).status_code == 200
+
+    client.delete(f"/api/videos/{videos[0]['id']}")
+    changed = client.get(path, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert videos[0]["id"] not in [video["id"] for video in changed.json()]
+
+
+def test_settings_etag_follows_settings_writes(client):
+    etag = client.get("/api/settings").headers["ETag"]
+    assert client.get("/api/settings", headers={"If-None-Match": etag}).status_code == 304
+
+    client.put("/api/settings", json={"companyName": "Otra"})
+
+    changed = client.get("/api/settings", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json()["companyName"] == "Otra"
+
+
+# Keyset pagination
+
+def test_next_cursor_walks_every_video_once(client, videos):
+    pages = [client.get("/api/videos", params={"limit": 4}).json()]
+    while pages[-1]["next_cursor"]:
+        pages.append(client.get("/api/videos", params={"limit": 4, "after": pages[-1]["next_cursor"]}).json())
+
+    assert [len(page["items"]) for page in pages] == [4, 2]
+    assert [video["id"] for page in pages for video in page["items"]] == sorted(video["id"] for video in videos)
+
+
+def test_next_cursor_is_none_on_an_exactly_full_last_page(client, videos):
+    page = client.get("/api/videos", params={"limit": 6}).json()
+    assert len(page["items"]) == 6
+    assert page["next_cursor"] is None
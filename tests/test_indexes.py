@@ -0,0 +1,58 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+from memory_db import InMemoryDatabase
+
+
+def progress(record_id, created_at, progress_percentage, watch_time, completed, user_email="ana@example.com"):
+    return {
+        "id": record_id,
+        "user_email": user_email,
+        "video_id": "v1",
+        "progress_percentage": progress_percentage,
+        "watch_time": watch_time,
+        "completed": completed,
+        "created_at": created_at,
+        "last_watched": created_at
+    }
+
+
+def test_startup_merges_duplicates_before_building_unique_indexes(server, monkeypatch):
+    start = datetime(2024, 1, 1)
+    legacy = InMemoryDatabase("legacy")
+    asyncio.run(legacy.video_progress.insert_many([
+        progress("b", start + timedelta(hours=1), 80.0, 200, False),
+        progress("a", start, 30.0, 500, True),
+        progress("c", start + timedelta(hours=2), 10.0, 50, False),
+        progress("d", start, 20.0, 70, False, user_email="beto@example.com"),
+    ]))
+    asyncio.run(legacy.users.insert_many([
+        {"id": "u2", "email": "ana@example.com", "name": "Ana 2", "created_at": start + timedelta(days=1)},
+        {"id": "u1", "email": "ana@example.com", "name": "Ana", "created_at": start},
+    ]))
+    # video_stats as the racing writers left it: one view per duplicate
+    asyncio.run(legacy.video_stats.insert_one({"video_id": "v1", "total_views": 4, "total_watch_time": 820}))
+
+    async def legacy_db():
+        return None, legacy
+    monkeypatch.setattr(server, "init_db", legacy_db)
+
+    with TestClient(server.app):
+        pass
+
+    records = asyncio.run(legacy.video_progress.find({}, {"_id": 0}).sort("user_email", 1).to_list(None))
+    assert [(record["id"], record["progress_percentage"], record["watch_time"], record["completed"]) for record in records] == [
+        ("a", 80.0, 500, True),
+        ("d", 20.0, 70, False),
+    ]
+    assert records[0]["created_at"] == start
+    assert records[0]["last_watched"] == start + timedelta(hours=2)
+    assert [user["id"] for user in asyncio.run(legacy.users.find({}).to_list(None))] == ["u1"]
+
+    indexes = asyncio.run(legacy.video_progress.index_information())
+    assert indexes["user_email_video_id"]["unique"] is True
+    assert "email" in asyncio.run(legacy.users.index_information())
+    stats = asyncio.run(legacy.video_stats.find_one({"video_id": "v1"}))
+    assert (stats["total_views"], stats["total_completions"], stats["total_watch_time"]) == (2, 1, 570)
@@ -0,0 +1,175 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError
+
+import memory_db
+from memory_db import InMemoryDatabase
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def db():
+    return InMemoryDatabase("test")
+
+
+@pytest.fixture
+def people(db):
+    run(db.people.insert_many([
+        {"name": "ana", "age": 31, "city": "CDMX", "tags": ["admin", "ventas"]},
+        {"name": "beto", "age": 25, "city": "GDL", "tags": ["ventas"]},
+        {"name": "carla", "age": 42, "city": "CDMX", "tags": []},
+        {"name": "dani", "city": "MTY"},
+    ]))
+    return db.people
+
+
+def names(docs):
+    return sorted(doc["name"] for doc in docs)
+
+
+@pytest.mark.parametrize("query, expected", [
+    ({"city": "CDMX"}, ["ana", "carla"]),
+    ({"age": {"$gte": 30}}, ["ana", "carla"]),
+    ({"age": {"$lt": 30}}, ["beto"]),
+    ({"age": {"$exists": False}}, ["dani"]),
+    ({"city": {"$in": ["GDL", "MTY"]}}, ["beto", "dani"]),
+    ({"city": {"$nin": ["CDMX"]}}, ["beto", "dani"]),
+    ({"tags": "ventas"}, ["ana", "beto"]),
+    ({"age": {"$not": {"$gte": 30}}}, ["beto", "dani"]),
+    ({"$or": [{"city": "MTY"}, {"age": 25}]}, ["beto", "dani"]),
+    ({"city": "CDMX", "age": {"$gt": 40}}, ["carla"]),
+])
+def test_find_filters(people, query, expected):
+    assert names(run(people.find(query).to_list(None))) == expected
+
+
+def test_find_sort_skip_limit_and_projection(people):
+    docs = run(people.find({"age": {"$exists": True}}, {"_id": 0, "name": 1}).sort("age", -1).skip(1).limit(1).to_list(None))
+    assert docs == [{"name": "ana"}]
+
+
+def test_update_operators(people):
+    run(people.update_one({"name": "ana"}, {"$inc": {"age": 1}, "$set": {"city": "QRO"}, "$unset": {"tags": ""}}))
+    run(people.update_one({"name": "beto"}, {"$max": {"age": 20}, "$min": {"score": 5}}))
+    ana = run(people.find_one({"name": "ana"}, {"_id": 0}))
+    beto = run(people.find_one({"name": "beto"}, {"_id": 0}))
+    assert ana == {"name": "ana", "age": 32, "city": "QRO"}
+    assert beto["age"] == 25 and beto["score"] == 5
+
+
+def test_upsert_seeds_equality_fields_and_set_on_insert(db):
+    update = {"$setOnInsert": {"created": 1}, "$max": {"progress": 10}}
+    result = run(db.progress.update_one({"user": "a", "video": "v"}, update, upsert=True))
+    assert result.upserted_id is not None
+    run(db.progress.update_one({"user": "a", "video": "v"}, {"$setOnInsert": {"created": 2}, "$max": {"progress": 5}}, upsert=True))
+    assert run(db.progress.find_one({}, {"_id": 0})) == {"user": "a", "video": "v", "created": 1, "progress": 10}
+
+
+def test_find_one_and_update_returns_previous_document(db):
+    before = run(db.counters.find_one_and_update(
+        {"_id": "c"}, {"$inc": {"n": 1}}, upsert=True, return_document=ReturnDocument.BEFORE
+    ))
+    after = run(db.counters.find_one_and_update({"_id": "c"}, {"$inc": {"n": 1}}, return_document=ReturnDocument.AFTER))
+    assert before is None
+    assert after == {"_id": "c", "n": 2}
+
+
+def test_unique_index_rejects_duplicates(db):
+    run(db.users.create_index("email", unique=True))
+    run(db.users.insert_one({"email": "a@x"}))
+    with pytest.raises(DuplicateKeyError):
+        run(db.users.insert_one({"email": "a@x"}))
+    run(db.users.insert_one({"email": "b@x"}))
+    with pytest.raises(DuplicateKeyError):
+        run(db.users.update_one({"email": "b@x"}, {"$set": {"email": "a@x"}}))
+    assert run(db.users.count_documents({})) == 2
+
+
+def test_unordered_bulk_write_reports_duplicate_key_errors(db):
+    run(db.users.create_index("email", unique=True))
+    run(db.users.insert_one({"email": "a@x"}))
+    with pytest.raises(BulkWriteError) as error:
+        run(db.users.bulk_write([
+            UpdateOne({"email": "b@x"}, {"$set": {"n": 1}}, upsert=True),
+            UpdateOne({"email": "c@x"}, {"$set": {"email": "a@x"}}, upsert=True),
+        ], ordered=False))
+    assert [entry["index"] for entry in error.value.details["upserted"]] == [0]
+    assert [entry["code"] for entry in error.value.details["writeErrors"]] == [11000]
+
+
+def test_aggregate_group_and_sort(people):
+    result = run(people.aggregate([
+        {"$match": {"age": {"$exists": True}}},
+        {"$group": {"_id": "$city", "people": {"$sum": 1}, "total_age": {"$sum": "$age"}, "oldest": {"$max": "$age"}}},
+        {"$sort": {"_id": 1}}
+    ]).to_list(None))
+    assert result == [
+        {"_id": "CDMX", "people": 2, "total_age": 73, "oldest": 42},
+        {"_id": "GDL", "people": 1, "total_age": 25, "oldest": 25},
+    ]
+
+
+def test_aggregate_lookup_unwind_and_facet(db, people):
+    run(db.cities.insert_many([{"code": "CDMX", "state": "CDMX"}, {"code": "GDL", "state": "Jalisco"}]))
+    result = run(people.aggregate([
+        {"$lookup": {"from": "cities", "localField": "city", "foreignField": "code", "as": "place"}},
+        {"$facet": {
+            "matched": [{"$unwind": "$place"}, {"$project": {"_id": 0, "name": 1, "state": "$place.state"}}],
+            "unmatched": [{"$match": {"place": []}}, {"$count": "n"}]
+        }}
+    ]).to_list(None))
+    assert len(result) == 1
+    assert sorted(result[0]["matched"], key=lambda doc: doc["name"]) == [
+        {"name": "ana", "state": "CDMX"}, {"name": "beto", "state": "Jalisco"}, {"name": "carla", "state": "CDMX"}
+    ]
+    assert result[0]["unmatched"] == [{"n": 1}]
+
+
+def test_aggregate_conditional_and_date_operators(db):
+    run(db.events.insert_many([
+        {"ts": datetime(2024, 3, 5, 14, 30), "done": True},
+        {"ts": datetime(2024, 3, 5, 15, 10), "done": False},
+    ]))
+    result = run(db.events.aggregate([
+        {"$group": {
+            "_id": {"day": {"$dayOfMonth": "$ts"}, "month": {"$month": "$ts"}},
+            "completed": {"$sum": {"$cond": ["$done", 1, 0]}},
+            "hours": {"$push": {"$hour": "$ts"}}
+        }}
+    ]).to_list(None))
+    assert result == [{"_id": {"day": 5, "month": 3}, "completed": 1, "hours": [14, 15]}]
+
+
+def test_ttl_index_expires_old_documents(db, monkeypatch):
+    monkeypatch.setattr(memory_db, "TTL_MONITOR_INTERVAL_SECONDS", 0)
+    run(db.sessions.create_index([("ts", 1)], expireAfterSeconds=3600))
+    run(db.sessions.insert_many([
+        {"name": "old", "ts": datetime.utcnow() - timedelta(hours=2)},
+        {"name": "new", "ts": datetime.utcnow()},
+    ]))
+    assert names(run(db.sessions.find({}).to_list(None))) == ["new"]
+
+
+def test_ttl_expiry_is_throttled_like_the_ttl_monitor(db):
+    run(db.sessions.create_index([("ts", 1)], expireAfterSeconds=3600))
+    run(db.sessions.insert_one({"name": "old", "ts": datetime.utcnow() - timedelta(hours=2)}))
+    # The monitor ran on the insert, before the document existed, and waits a minute to run again
+    assert run(db.sessions.count_documents({})) == 1
+
+
+def test_time_series_collection_with_ttl(db, monkeypatch):
+    monkeypatch.setattr(memory_db, "TTL_MONITOR_INTERVAL_SECONDS", 0)
+    run(db.create_collection("events", timeseries={"timeField": "ts", "metaField": "meta"}, expireAfterSeconds=60))
+    with pytest.raises(CollectionInvalid):
+        run(db.create_collection("events"))
+    run(db.events.insert_many([
+        {"ts": datetime.utcnow() - timedelta(minutes=5), "meta": {"id": 1}},
+        {"ts": datetime.utcnow(), "meta": {"id": 2}},
+    ]))
+    assert [doc["meta"]["id"] for doc in run(db.events.find({}).to_list(None))] == [2]
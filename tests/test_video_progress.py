@@ -0,0 +1,197 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+def heartbeat(video, user_email="ana@example.com", progress=10.0, watch_time=60, completed=False):
+    return {
+        "user_email": user_email,
+        "video_id": video["id"],
+        "progress_percentage": progress,
+        "watch_time": watch_time,
+        "completed": completed
+    }
+
+
+def get_progress(client, video, user_email="ana@example.com"):
+    return client.get(f"/api/video-progress/{user_email}/{video['id']}").json()
+
+
+def get_stats(client, video):
+    return client.get(f"/api/video-stats/{video['id']}").json()
+
+
+# Monotonic merge
+
+def test_progress_only_moves_forward(client, videos):
+    video = videos[0]
+    client.post("/api/video-progress", json=heartbeat(video, progress=60.0, watch_time=360, completed=True))
+    stale = client.post("/api/video-progress", json=heartbeat(video, progress=20.0, watch_time=120, completed=False))
+
+    assert stale.status_code == 200
+    for progress in (stale.json(), get_progress(client, video)):
+        assert progress["progress_percentage"] == 60.0
+        assert progress["watch_time"] == 360
+        assert progress["completed"] is True
+
+
+def test_progress_merges_each_field_independently(client, videos):
+    video = videos[0]
+    client.post("/api/video-progress", json=heartbeat(video, progress=50.0, watch_time=100))
+    client.post("/api/video-progress", json=heartbeat(video, progress=40.0, watch_time=200))
+
+    progress = get_progress(client, video)
+    assert (progress["progress_percentage"], progress["watch_time"]) == (50.0, 200)
+    assert len(client.get("/api/video-progress/ana@example.com").json()) == 1
+
+
+# video_stats deltas and rebuild
+
+def test_video_stats_follow_progress_writes(client, videos):
+    video = videos[0]
+    client.post("/api/video-progress", json=heartbeat(video, "ana@example.com", watch_time=100))
+    client.post("/api/video-progress", json=heartbeat(video, "beto@example.com", watch_time=300))
+    assert get_stats(client, video) == {
+        "total_views": 2, "total_completions": 0, "average_completion_rate": 0.0, "average_watch_time": 200
+    }
+
+    # A later heartbeat adds its extra watch time and the completion, not a new view
+    client.post("/api/video-progress", json=heartbeat(video, "ana@example.com", progress=100.0, watch_time=500, completed=True))
+    assert get_stats(client, video) == {
+        "total_views": 2, "total_completions": 1, "average_completion_rate": 50.0, "average_watch_time": 400
+    }
+
+    # A correction may lower the values; the stats follow it down
+    response = client.put(f"/api/video-progress/ana@example.com/{video['id']}", json={"watch_time": 100, "completed": False})
+    assert response.status_code == 200
+    assert get_stats(client, video) == {
+        "total_views": 2, "total_completions": 0, "average_completion_rate": 0.0, "average_watch_time": 200
+    }
+
+
+def test_rebuild_recomputes_video_stats_from_progress(server, client, videos):
+    for index, video in enumerate(videos[:3]):
+        client.post("/api/video-progress", json=heartbeat(video, watch_time=100 * (index + 1), completed=index == 0))
+    expected = [get_stats(client, video) for video in videos[:3]]
+
+    async def corrupt():
+        await server.db.video_stats.update_one({"video_id": videos[0]["id"]}, {"$set": {"total_views": 40}})
+        await server.db.video_stats.delete_one({"video_id": videos[1]["id"]})
+        await server.db.video_stats.insert_one({"video_id": "borrado", "total_views": 3})
+    asyncio.run(corrupt())
+
+    response = client.post("/api/admin/video-stats/rebuild")
+    assert response.status_code == 200
+    assert response.json()["videos"] == 3
+    assert [get_stats(client, video) for video in videos[:3]] == expected
+    assert asyncio.run(server.db.video_stats.count_documents({"video_id": "borrado"})) == 0
+
+
+# Batch endpoint
+
+def test_batch_reports_a_status_per_item(client, videos):
+    client.post("/api/video-progress", json=heartbeat(videos[0], watch_time=100))
+
+    response = client.post("/api/video-progress/batch", json=[
+        heartbeat(videos[0], watch_time=200),
+        heartbeat(videos[1], watch_time=50),
+        heartbeat(videos[1], progress=30.0, watch_time=80),
+    ])
+
+    assert response.status_code == 200
+    assert [(item["index"], item["video_id"], item["status"]) for item in response.json()["results"]] == [
+        (0, videos[0]["id"], "updated"),
+        (1, videos[1]["id"], "created"),
+        (2, videos[1]["id"], "merged"),
+    ]
+    merged = get_progress(client, videos[1])
+    assert (merged["progress_percentage"], merged["watch_time"]) == (30.0, 80)
+    assert get_stats(client, videos[1])["total_views"] == 1
+    assert get_stats(client, videos[0])["average_watch_time"] == 200
+
+
+def test_batch_deltas_survive_writes_racing_the_batch(server, client, videos, monkeypatch):
+    client.post("/api/video-progress", json=heartbeat(videos[0], watch_time=100))
+    progress = server.db.video_progress
+    bulk_write = progress.bulk_write
+
+    async def racing_bulk_write(operations, **kwargs):
+        # Live heartbeats land after the batch read the records but before it writes
+        for video, watch_time in ((videos[0], 200), (videos[1], 40)):
+            await server.create_or_update_video_progress(server.VideoProgressCreate(**heartbeat(video, watch_time=watch_time)))
+        return await bulk_write(operations, **kwargs)
+    monkeypatch.setattr(progress, "bulk_write", racing_bulk_write)
+
+    response = client.post("/api/video-progress/batch", json=[
+        heartbeat(videos[0], watch_time=150),
+        heartbeat(videos[1], watch_time=90, completed=True),
+    ])
+
+    assert [item["status"] for item in response.json()["results"]] == ["updated", "updated"]
+    assert get_progress(client, videos[0])["watch_time"] == 200
+    assert get_stats(client, videos[0])["average_watch_time"] == 200
+    assert get_progress(client, videos[1])["watch_time"] == 90
+    assert get_stats(client, videos[1]) == {
+        "total_views": 1, "total_completions": 1, "average_completion_rate": 100.0, "average_watch_time": 90
+    }
+    # The watch events carry the same deltas as video_stats
+    events = asyncio.run(server.db.watch_events.find({}).to_list(None))
+    assert sum(event["watch_time"] for event in events) == 290
+    assert sum(event["view"] for event in events) == 2
+
+
+def test_batch_rejects_oversized_requests(server, client, videos, monkeypatch):
+    monkeypatch.setattr(server, "progress_batch_max_size", 2)
+    response = client.post("/api/video-progress/batch", json=[heartbeat(video) for video in videos[:3]])
+    assert response.status_code == 413
+
+
+# Write-behind buffer
+
+@pytest.fixture
+def buffered_server(server, monkeypatch):
+    monkeypatch.setattr(server, "progress_write_behind", True)
+    # Only explicit flushes and the shutdown drain write to the database
+    monkeypatch.setattr(server, "progress_flush_interval_seconds", 3600)
+    return server
+
+
+def test_buffer_coalesces_heartbeats_until_drained(buffered_server, videos_factory):
+    server = buffered_server
+    with TestClient(server.app) as client:
+        videos = videos_factory(client)
+        for watch_time in (60, 120, 90):
+            client.post("/api/video-progress", json=heartbeat(videos[0], watch_time=watch_time))
+        client.post("/api/video-progress", json=heartbeat(videos[1], watch_time=30, completed=True))
+
+        # Reads see the buffered state before anything is written
+        assert get_progress(client, videos[0])["watch_time"] == 120
+        assert asyncio.run(server.db.video_progress.count_documents({})) == 0
+        stats = client.get("/api/admin/write-buffer").json()
+        assert (stats["enabled"], stats["pending"], stats["accepted"], stats["flushes"]) == (True, 2, 4, 0)
+
+    # Shutdown drains the buffer: one record per key, with its merged state and stats
+    records = asyncio.run(server.db.video_progress.find({}, {"_id": 0}).sort("watch_time", 1).to_list(None))
+    assert [(record["video_id"], record["watch_time"], record["completed"]) for record in records] == [
+        (videos[1]["id"], 30, True),
+        (videos[0]["id"], 120, False),
+    ]
+    assert server.progress_buffer.stats()["coalescing_ratio"] == 0.5
+    stats = asyncio.run(server.db.video_stats.find({}, {"_id": 0}).sort("total_watch_time", 1).to_list(None))
+    assert [(entry["total_views"], entry.get("total_completions", 0), entry["total_watch_time"]) for entry in stats] == [
+        (1, 1, 30), (1, 0, 120)
+    ]
+
+
+def test_put_flushes_buffered_heartbeats_first(buffered_server, videos_factory):
+    server = buffered_server
+    with TestClient(server.app) as client:
+        videos = videos_factory(client)
+        client.post("/api/video-progress", json=heartbeat(videos[0], progress=80.0, watch_time=480))
+
+        response = client.put(f"/api/video-progress/ana@example.com/{videos[0]['id']}", json={"watch_time": 200})
+
+        assert response.status_code == 200
+        assert get_progress(client, videos[0])["watch_time"] == 200
+        assert get_stats(client, videos[0])["average_watch_time"] == 200
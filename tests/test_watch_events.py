@@ -0,0 +1,200 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from memory_db import InMemoryDatabase
+
+
+def heartbeat(video, user_email="ana@example.com", progress=10.0, watch_time=60, completed=False):
+    return {
+        "user_email": user_email,
+        "video_id": video["id"],
+        "progress_percentage": progress,
+        "watch_time": watch_time,
+        "completed": completed
+    }
+
+
+def rolled_up_watch_time(server, video, granularity="hour"):
+    rollups = asyncio.run(server.db.watch_rollups.find(
+        {"granularity": granularity, "scope": "video", "key": video["id"]}
+    ).to_list(None))
+    return sum(rollup["watch_time"] for rollup in rollups)
+
+
+# Rollup passes
+
+def test_late_events_behind_the_watermark_are_rolled_up(server, client, videos, monkeypatch):
+    monkeypatch.setattr(server, "WATCH_ROLLUP_LAG_SECONDS", 0)
+    client.post("/api/video-progress", json=heartbeat(videos[0], watch_time=100))
+    client.post("/api/admin/watch-rollups/run")
+    watermark = asyncio.run(server.db.watch_rollup_state.find_one({"_id": server.WATCH_ROLLUP_STATE_ID}))["watermark"]
+
+    # Stamped by a worker in the hour before the watermark's, inserted after the pass
+    asyncio.run(server.db.watch_events.insert_one({
+        "ts": server._hour_start(watermark) - timedelta(minutes=1),
+        "meta": {"video_id": videos[0]["id"], "user_email": "beto@example.com"},
+        "watch_time": 40, "view": 1, "completed": 0, "progress_percentage": 5.0
+    }))
+    client.post("/api/admin/watch-rollups/run")
+
+    assert rolled_up_watch_time(server, videos[0]) == 140
+    assert rolled_up_watch_time(server, videos[0], "day") == 140
+
+
+def test_passes_recompute_buckets_instead_of_adding_to_them(server, client, videos, monkeypatch):
+    monkeypatch.setattr(server, "WATCH_ROLLUP_LAG_SECONDS", 0)
+    client.post("/api/video-progress", json=heartbeat(videos[0], watch_time=100))
+    client.post("/api/video-progress", json=heartbeat(videos[0], "beto@example.com", watch_time=50))
+    client.post("/api/admin/watch-rollups/run")
+    client.post("/api/admin/watch-rollups/run")
+    assert rolled_up_watch_time(server, videos[0]) == 150
+
+    # A damaged bucket inside the rescan window is rebuilt from the raw events
+    asyncio.run(server.db.watch_rollups.update_many(
+        {"scope": "video", "key": videos[0]["id"]}, {"$set": {"watch_time": 999}}
+    ))
+    client.post("/api/admin/watch-rollups/run")
+    assert rolled_up_watch_time(server, videos[0]) == 150
+    assert rolled_up_watch_time(server, videos[0], "day") == 150
+
+
+def test_a_slower_pass_does_not_overwrite_a_newer_bucket(server, client, videos, monkeypatch):
+    monkeypatch.setattr(server, "WATCH_ROLLUP_LAG_SECONDS", 0)
+    client.post("/api/video-progress", json=heartbeat(videos[0], watch_time=100))
+    client.post("/api/admin/watch-rollups/run")
+    bucket = asyncio.run(server.db.watch_rollups.find_one({"granularity": "hour", "scope": "video", "key": videos[0]["id"]}))
+
+    # A pass that started before the last one finishes late with fewer events
+    stale = {("video", videos[0]["id"], bucket["bucket"]): {"watch_time": 1, "views": 0, "completions": 0, "events": 1}}
+    asyncio.run(server._write_rollups("hour", stale, bucket["computed_until"] - timedelta(seconds=5)))
+
+    assert rolled_up_watch_time(server, videos[0]) == 100
+    assert asyncio.run(server.db.watch_rollups.count_documents({"granularity": "hour", "scope": "video"})) == 1
+
+
+# TTL configuration
+
+@pytest.fixture
+def existing_db(server, monkeypatch):
+    """A database left by an earlier deployment, with watch_events kept for one day."""
+    database = InMemoryDatabase("existing")
+
+    async def existing():
+        return None, database
+    monkeypatch.setattr(server, "init_db", existing)
+    monkeypatch.setattr(server, "watch_events_ttl_days", 7)
+    return database
+
+
+def test_changed_ttl_is_applied_to_an_existing_time_series_collection(server, existing_db):
+    asyncio.run(existing_db.create_collection(
+        "watch_events", timeseries={"timeField": "ts", "metaField": "meta"}, expireAfterSeconds=86400
+    ))
+
+    with TestClient(server.app):
+        pass
+
+    infos = asyncio.run(asyncio.run(existing_db.list_collections(filter={"name": "watch_events"})).to_list(None))
+    assert infos[0]["options"]["expireAfterSeconds"] == 7 * 86400
+
+
+def test_changed_ttl_is_applied_to_the_ttl_index_of_a_regular_collection(server, existing_db):
+    asyncio.run(existing_db.watch_events.create_index([("ts", 1)], name="ts_ttl", expireAfterSeconds=86400))
+    recent = datetime.utcnow() - timedelta(days=3)
+    asyncio.run(existing_db.watch_events.insert_one({"ts": recent, "meta": {"video_id": "v1"}, "watch_time": 10}))
+
+    with TestClient(server.app):
+        pass
+
+    indexes = asyncio.run(existing_db.watch_events.index_information())
+    assert indexes["ts_ttl"]["expireAfterSeconds"] == 7 * 86400
+    assert asyncio.run(existing_db.watch_events.count_documents({})) == 1
+
+
+# Ranged statistics
+
+def watch_event(video, ts, watch_time, user_email="ana@example.com", view=1):
+    return {
+        "ts": ts,
+        "meta": {"video_id": video["id"], "user_email": user_email},
+        "watch_time": watch_time, "view": view, "completed": 0, "progress_percentage": 10.0
+    }
+
+
+def test_ranges_read_day_buckets_inside_and_hour_buckets_at_the_ends(server, client, videos):
+    video = videos[0]
+    asyncio.run(server.db.watch_events.insert_many([
+        watch_event(video, datetime(2024, 1, 1, 9), 1),
+        watch_event(video, datetime(2024, 1, 1, 10, 15), 2),
+        watch_event(video, datetime(2024, 1, 2, 12), 4),
+        watch_event(video, datetime(2024, 1, 3, 23, 59), 8),
+        watch_event(video, datetime(2024, 1, 4, 4, 30), 16),
+        watch_event(video, datetime(2024, 1, 4, 5), 32),
+    ]))
+    client.post("/api/admin/watch-rollups/run")
+    # Whole days must come from their day buckets
+    asyncio.run(server.db.watch_rollups.delete_many({
+        "granularity": "hour", "bucket": {"$gte": datetime(2024, 1, 2), "$lt": datetime(2024, 1, 4)}
+    }))
+
+    # 10:30 widens to the 10:00 hour; the 05:00 event is past the exclusive end
+    partial = {"from": "2024-01-01T10:30:00", "to": "2024-01-04T05:00:00"}
+    stats = client.get("/api/admin/stats", params=partial).json()
+    assert (stats["overview"]["total_watch_time"], stats["overview"]["total_video_views"]) == (30, 4)
+    assert stats["range"]["resolution"] == "hour"
+    dashboard = client.get("/api/dashboard/ana@example.com", params=partial).json()
+    assert dashboard["total_watch_time"] == 30
+
+    whole_days = client.get("/api/admin/stats", params={"from": "2024-01-02T00:00:00", "to": "2024-01-04T00:00:00"}).json()
+    assert whole_days["overview"]["total_watch_time"] == 12
+    assert whole_days["range"]["resolution"] == "day"
+
+
+def test_ranged_top_videos_and_categories_come_from_the_range(server, client, videos):
+    asyncio.run(server.db.watch_events.insert_many([
+        watch_event(videos[0], datetime(2024, 1, 1, 12), 10),
+        watch_event(videos[1], datetime(2024, 1, 2, 12), 20, "beto@example.com"),
+        watch_event(videos[1], datetime(2024, 1, 2, 13), 20),
+        watch_event(videos[2], datetime(2024, 1, 5), 40),
+    ]))
+    client.post("/api/admin/watch-rollups/run")
+
+    stats = client.get("/api/admin/stats", params={"from": "2024-01-01T00:00:00", "to": "2024-01-03T00:00:00"}).json()
+
+    assert [(entry["video"]["id"], entry["view_count"]) for entry in stats["top_videos"]] == [
+        (videos[1]["id"], 2), (videos[0]["id"], 1)
+    ]
+    assert stats["top_videos"][0]["video"]["stats"]["average_watch_time"] == 20
+    by_category = {name: entry["total_views"] for name, entry in stats["category_stats"].items() if entry["total_views"]}
+    categories = {category["id"]: category["name"] for category in client.get("/api/categories").json()}
+    # videos[0] and videos[2] share a category; videos[2] is outside the range
+    assert by_category == {categories[videos[0]["categoryId"]]: 1, categories[videos[1]["categoryId"]]: 2}
+
+
+# Trending
+
+def day_rollup(video, bucket, views):
+    return {"granularity": "day", "scope": "video", "key": video["id"], "bucket": bucket,
+            "views": views, "watch_time": 0, "completions": 0, "events": views}
+
+
+def test_trending_decays_views_by_their_age(server, client, videos, monkeypatch):
+    monkeypatch.setattr(server, "trending_half_life_hours", 72)
+    now = datetime(2024, 1, 4)
+    asyncio.run(server.db.watch_rollups.insert_many([
+        day_rollup(videos[0], datetime(2024, 1, 1), 4),   # one half-life old
+        day_rollup(videos[1], datetime(2024, 1, 4), 1),   # brand new
+        day_rollup(videos[1], datetime(2023, 12, 29), 8),  # two half-lives old
+        day_rollup(videos[2], datetime(2023, 12, 20), 100),  # outside the window
+    ]))
+
+    trending = asyncio.run(server.trending_videos(10, now))
+
+    assert [(entry["video"]["id"], entry["trending_score"], entry["recent_views"]) for entry in trending] == [
+        (videos[1]["id"], 3.0, 9),
+        (videos[0]["id"], 2.0, 4),
+    ]
+    assert [entry["video"]["id"] for entry in asyncio.run(server.trending_videos(1, now))] == [videos[1]["id"]]